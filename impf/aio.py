@@ -0,0 +1,191 @@
+""" asyncio execution engine – alternative to the ThreadPoolExecutor loop in main.py.
+Selenium and requests are blocking, so they are offloaded to the executor only for the
+duration of a call; all waiting in between happens in the event loop """
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import partial
+from time import time
+from typing import Any, Callable, Dict, List
+
+import settings
+from impf import alert, metrics
+from impf.api import API
+from impf.browser import Browser
+from impf.limiter import limiter
+from impf.pool import BrowserPool
+from impf.slots import tracker
+
+logger = logging.getLogger(__name__)
+
+# Remote bookings wait up to WAIT_SMS_MANUAL per profile for the user – on their own
+# threads, so they can't starve the executor used for polling and browsers
+bookings = ThreadPoolExecutor(thread_name_prefix='booking')
+
+
+async def run_blocking(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """ Runs a blocking function in the loop's executor """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+
+async def pace(seconds: int, server: str = '') -> None:
+    """ Non-blocking counterpart of limiter.pace – waits for the server's
+    rate limit instead of a fixed time if RATE_LIMIT_ENABLED """
+    if not settings.RATE_LIMIT_ENABLED: return await asyncio.sleep(seconds)
+    if server: await asyncio.sleep(limiter(server).delay())
+
+
+async def send_alert(message: str) -> None:
+    """ Waits for all backends to deliver the alert without blocking the event loop """
+    await asyncio.gather(*(asyncio.wrap_future(f) for f in alert.send_alert(message)))
+
+
+@dataclass
+class AsyncAPI:
+    """ Awaitable facade for API – the number of requests in flight is
+    bounded by `requests` instead of by the number of threads """
+    api: API
+    requests: asyncio.Semaphore
+
+    async def control_appointments(self) -> dict:
+        async with self.requests:
+            return await run_blocking(self.api.control_appointments)
+
+    async def remote_booking(self) -> None:
+        # Waits for user input via chat app; occupies one booking thread while waiting
+        await asyncio.get_running_loop().run_in_executor(bookings, self.api.remote_booking)
+
+
+def cookie_source(browsers: asyncio.Semaphore, pool: BrowserPool = None) -> Callable[[API], List[dict]]:
+    """ Refreshes cookies of a detached REST session with a (pooled) browser – called from an
+    executor thread, but bounded by `browsers` like every other browser of the event loop """
+    loop = asyncio.get_running_loop()
+
+    def refresh(api: API) -> List[dict]:
+        asyncio.run_coroutine_threadsafe(browsers.acquire(), loop).result()
+        try:
+            location = {'location': api.zip_code, 'code': api.code}
+            x = pool.acquire(location) if pool else Browser(**location)
+            try:
+                x.main_page()
+                x.location_page()
+                return x.driver.get_cookies()
+            finally:
+                if pool: pool.release(x)
+                else: x.driver.quit()
+        finally:
+            loop.call_soon_threadsafe(browsers.release)
+    return refresh
+
+
+def detach(x: Browser, refresh: Callable[[API], List[dict]] = None) -> API:
+    """ Detaches the REST session from the browser, so the browser can be closed
+    while polling continues; cookies are refreshed via `refresh` """
+    api = x.api
+    api.code = x.code
+    api.zip_code = x.location[:5]
+    api.driver = None
+    api.cookie_source = refresh
+    return api
+
+
+async def alert_appointment(api: API, location: str, requests: asyncio.Semaphore, seen: float,
+                            changes: str = '') -> None:
+    """ Browserless counterpart of Browser.alert_appointment """
+    logger.warning(f'{location[:5]}: Available appointments! Waiting for user input')
+    link = f'{api.host}/impftermine/suche/{api.code}/{api.zip_code}'
+    alert = settings.ALERT_AVAILABLE.replace('{{ LOCATION }}', location).replace('{{ LINK }}', link)
+    await send_alert(f'{alert}  \n{changes}' if changes else alert)
+    metrics.observe('impf_alert_latency_seconds', time() - seen, location=location[:5], server=api.server_id)
+    if not (settings.BOOK_REMOTELY or settings.AUTO_BOOK): return
+
+    try:
+        await AsyncAPI(api, requests).remote_booking()
+    except:
+        logger.exception(f'{location[:5]}: Unexpected exception occurred trying to book appointments remotely!')
+        await send_alert('Appointment could not be booked – please continue manually!')
+
+
+async def poll(api: AsyncAPI, location: str, zip_codes: List[str]) -> None:
+    """ Polls appointments via REST API for a location (and all centers on the same
+    server in `zip_codes`) after the browser passed waiting room and Vermittlungscode """
+    _logger = settings.LocationAdapter(logger, {'location': location[:5]})
+    zip_codes = zip_codes or [location[:5]]
+    _logger.info(f'ASYNC_ENABLED - polling appointments for {", ".join(zip_codes)} via REST API '
+                 f'every {settings.WAIT_HYBRID_POLLING}s')
+
+    while True:
+        for zip_code in zip_codes:
+            api.api.zip_code = zip_code
+            appointments = await api.control_appointments()
+            if not appointments:
+                _logger.warning('REST API did not return appointments - rescheduling location')
+                return
+
+            termine = appointments.get('termine')
+            changes = tracker.diff(zip_code, termine)
+            if termine and not changes and settings.ALERT_CHANGES_ONLY:
+                _logger.info(f'{len(termine)} appointments for {zip_code} unchanged since the last alert')
+            elif termine:
+                seen = time()
+                _logger.warning(f'REST API returned {len(termine)} appointments for {zip_code}!')
+                center = location if zip_code == location[:5] else zip_code
+                await alert_appointment(api.api, center, api.requests, seen, changes.summary())
+                tracker.store(zip_code, termine)
+                return
+            tracker.store(zip_code, termine)
+
+        if not settings.RESCAN_APPOINTMENT: return
+        await pace(settings.WAIT_HYBRID_POLLING, api.api.server_id)
+
+
+async def impf_me(location: Dict, browsers: asyncio.Semaphore, requests: asyncio.Semaphore,
+                  pool: BrowserPool = None) -> Dict:
+    """ Coroutine counterpart of main.impf_me; only holds a browser
+    (and an executor thread) while the browser is actually needed """
+    async with browsers:
+        x = await run_blocking(pool.acquire, location) if pool else await run_blocking(Browser, **location)
+        await run_blocking(x.control_main)
+        # Pooled browsers are reinitialized by the next worker; take what we need first
+        api = detach(x, cookie_source(browsers, pool)) if x.api is not None else None
+        location, location_full = {'location': x.location, 'code': x.code, 'zip_codes': x.zip_codes}, \
+            x.location_full or x.location
+        if pool: await run_blocking(pool.release, x)
+        elif not x.keep_browser: await run_blocking(x.driver.quit)
+
+    if api is not None:
+        await poll(AsyncAPI(api, requests), location_full, location.get('zip_codes'))
+
+    if not settings.RATE_LIMIT_ENABLED:
+        logger.info(f'Waiting until {(datetime.now() + timedelta(seconds=settings.WAIT_LOCATIONS)).strftime("%H:%M:%S")} '
+                    f'before checking {location.get("location")} again')
+    await pace(settings.WAIT_LOCATIONS)
+    return location
+
+
+async def run(locations: List[Dict], pool: BrowserPool = None) -> None:
+    """ Schedules all locations in one event loop and reschedules each location once it's done """
+    # Browsers are blocking for the full check, REST calls only for the request itself
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=settings.CONCURRENT_WORKERS + settings.ASYNC_MAX_REQUESTS + 4))
+    browsers = asyncio.Semaphore(settings.CONCURRENT_WORKERS)
+    requests = asyncio.Semaphore(settings.ASYNC_MAX_REQUESTS)
+
+    tasks = {}
+    for location in locations:
+        tasks[asyncio.ensure_future(impf_me(location, browsers, requests, pool))] = location
+        # Only stagger browsers starting right away; the rest queue up on `browsers`
+        if len(tasks) < settings.CONCURRENT_WORKERS: await pace(settings.WAIT_CONCURRENT)
+
+    while tasks:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            location = tasks.pop(task)
+            try:
+                location = task.result()
+            except:
+                logger.exception(f'An unexpected exception occurred checking {location.get("location")}')
+            tasks[asyncio.ensure_future(impf_me(location, browsers, requests, pool))] = location
@@ -1,14 +1,13 @@
-import os
-import re
 import logging
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from time import time
-from typing import Union, Callable
+from typing import List
 
 import settings
-from impf.constructors import zulip_client, zulip_send_payload, zulip_read_payload, get_command
-
-import requests
-
+from impf import metrics, transport
+from impf.constructors import zulip_client, zulip_send_payload, zulip_read_payload, zulip_narrow, get_command
 from impf.decorators import alert_resilience
 from impf.exceptions import AlertError
 
@@ -18,65 +17,42 @@ HEADERS = {
 }
 
 logger = logging.getLogger(__name__)
-SMS_RE = re.compile(r"sms:\d{3}-?\d{3}")
-APPT_RE = re.compile(r"appt:\d")
-
-
-def sms_code(string: str) -> Union[str, None]:
-    """ Checks if string contains a valid SMS code """
-    if not string: return ''
-    m = SMS_RE.search(string.strip())
-    if m: m = m.group().replace('-', '').replace('sms:', '')
-    return m
-
-
-def appointment_slot(string: str) -> Union[str, None]:
-    """ Checks if string contains a valid appointment wish """
-    if not string: return ''
-    m = APPT_RE.search(string.strip())
-    if m: m = m.group().replace('appt:', '')
-    return m
-
-
-def _read_backend(backend_func: Callable, match_func: Callable) -> str:
-    """ Helper function to abstract backend reads """
-    code = backend_func(match_func)
-    if code:
-        logger.info(f'Read {match_func.__name__.upper()} Code from '
-                    f'{backend_func.__name__.replace("_read", "").capitalize()}: {code}')
-    return code
-
-
-def read_backend(case: str) -> str:
-    """ Reads the SMS Code from any of the confired alerting backends and returns it as string """
-    match_func = sms_code if case == 'sms' else appointment_slot
-    code = ''
-    if settings.ZULIP_ENABLED:
-        code = _read_backend(zulip_read, match_func) or code
-    if settings.TELEGRAM_ENABLED:
-        code = _read_backend(telegram_read, match_func) or code
-    return code
-
-
-def send_alert(message: str) -> None:
+# Alerts are sent concurrently over pooled keep-alive connections
+_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix='alert')
+_session = transport.session(HEADERS)
+# Read cursors – only ever advanced by the impf.inbox reader threads
+_telegram_offset = 0
+_zulip_last_id = 0
+_zulip_queue = {}
+
+
+def send_alert(message: str) -> List[Future]:
+    """ Sends the alert to all configured backends concurrently – a slow backend neither
+    delays the other backends nor the calling worker; returns the pending deliveries """
     logger.info(f'Sending alert "{message}"')
+    backends = []
     if settings.COMMAND_ENABLED:
-        execute_command()
+        backends.append(execute_command)
     if settings.ZULIP_ENABLED:
-        zulip_send(message)
+        backends.append(partial(zulip_send, message))
     if settings.TELEGRAM_ENABLED:
-        telegram_send(message)
+        backends.append(partial(telegram_send, message))
     if settings.SLACK_ENABLED:
-        slack_send(message)
+        backends.append(partial(slack_send, message))
     if settings.PUSHOVER_ENABLED:
-        pushover_send(message)
+        backends.append(partial(pushover_send, message))
     if settings.GOTIFY_ENABLED:
-        gotify_send(message)
+        backends.append(partial(gotify_send, message))
+    for backend in backends:
+        name = getattr(backend, 'func', backend).__name__
+        metrics.inc('impf_alerts_total', backend=name.replace('_send', '').replace('execute_', ''))
+    return [_executor.submit(backend) for backend in backends]
 
 
 @alert_resilience
 def execute_command() -> None:
-    os.system(get_command())
+    # Don't wait for e.g. text-to-speech to finish
+    subprocess.Popen(get_command(), shell=True)
 
 
 @alert_resilience
@@ -91,16 +67,44 @@ def zulip_send(message: str) -> None:
 
 
 @alert_resilience
-def zulip_read(match_func: Callable) -> Union[None, str]:
+def zulip_read(timeout: int = 0) -> List[str]:
+    """ Returns the messages received since the last read; with `timeout` the event queue
+    is long polled, returning as soon as a message arrives or after Zulip's heartbeat (~1 min) """
+    global _zulip_last_id
     client = zulip_client()
-    if client is None: return
+    if client is None: return []
+    if timeout and _zulip_queue: return zulip_read_events(client)
+
     request = zulip_read_payload()
     r = client.get_messages(request)
     if r.get('result') != 'success': raise AlertError(301, r)
-    for message in r.get('messages'):
-        # wenn im erwarteten Format und innerhalb der letzten 2 Minuten
-        if match_func(message.get('content')) and time() - message.get('timestamp') <= 120:
-            return match_func(message.get('content'))
+    # innerhalb der letzten 2 Minuten und noch nicht gelesen
+    messages = [m for m in r.get('messages') if m.get('id') > _zulip_last_id and time() - m.get('timestamp') <= 120]
+    _zulip_last_id = max([_zulip_last_id] + [m.get('id') for m in r.get('messages')])
+
+    if timeout:
+        r = client.register(event_types=['message'], narrow=zulip_narrow())
+        if r.get('result') != 'success': raise AlertError(301, r)
+        _zulip_queue.update(queue_id=r.get('queue_id'), last_event_id=r.get('last_event_id'))
+    return [m.get('content') for m in messages]
+
+
+def zulip_read_events(client) -> List[str]:
+    global _zulip_last_id
+    r = client.get_events(**_zulip_queue)
+    if r.get('result') != 'success':
+        # Queues are garbage collected after ~10 minutes without reads
+        if r.get('code') == 'BAD_EVENT_QUEUE_ID': _zulip_queue.clear()
+        raise AlertError(301, r)
+    messages = []
+    for event in r.get('events'):
+        _zulip_queue['last_event_id'] = max(_zulip_queue['last_event_id'], event.get('id'))
+        message = event.get('message', {})
+        if event.get('type') != 'message' or message.get('id') <= _zulip_last_id: continue
+        _zulip_last_id = message.get('id')
+        messages.append(message.get('content'))
+    return messages
+
 
 @alert_resilience
 def slack_send(message: str) -> None:
@@ -110,7 +114,7 @@ def slack_send(message: str) -> None:
         'username': 'Impf-Bot.py'
     }
 
-    r = requests.post(url, json=payload, headers=HEADERS)
+    r = _session.post(url, json=payload, timeout=settings.ALERT_TIMEOUT)
     if r.status_code != 200: raise AlertError(r.status_code, r.text)
     logger.debug(r)
 
@@ -123,28 +127,33 @@ def telegram_send(message: str) -> None:
         'text': message
     }
 
-    r = requests.get(url, params=params, headers=HEADERS)
+    r = _session.get(url, params=params, timeout=settings.ALERT_TIMEOUT)
     if r.status_code != 200: raise AlertError(r.status_code, r.text)
     logger.debug(r)
 
 
 @alert_resilience
-def telegram_read(match_func: Callable) -> Union[None, str]:
+def telegram_read(timeout: int = 0) -> List[str]:
+    """ Returns the messages received since the last read; with `timeout`
+    Telegram holds the request open until a new update arrives """
+    global _telegram_offset
     url = f'https://api.telegram.org/bot{settings.TELEGRAM_API_TOKEN}/getUpdates'
     params = {
         'chat_id': settings.TELEGRAM_CHAT_ID,
-        'offset': -1
+        'offset': _telegram_offset or -1,
+        'timeout': timeout
     }
 
-    r = requests.get(url, params=params, headers=HEADERS)
+    r = _session.get(url, params=params, timeout=settings.ALERT_TIMEOUT + timeout)
     logger.debug(r)
     if r.status_code != 200: raise AlertError(r.status_code, r.text)
-    for message in r.json().get('result'):
-        _message = message.get('message')
-        if not _message: return
-        # wenn im erwarteten Format und innerhalb der letzten 2 Minuten
-        if match_func(_message.get('text')) and time() - _message.get('date') <= 120:
-            return match_func(_message.get('text'))
+    messages = []
+    for update in r.json().get('result'):
+        _telegram_offset = max(_telegram_offset, update.get('update_id') + 1)
+        message = update.get('message')
+        # innerhalb der letzten 2 Minuten
+        if message and time() - message.get('date') <= 120: messages.append(message.get('text'))
+    return messages
 
 
 @alert_resilience
@@ -159,7 +168,7 @@ def pushover_send(message: str) -> None:
         'message': message
     }
 
-    r = requests.post(url, data=data)
+    r = _session.post(url, data=data, timeout=settings.ALERT_TIMEOUT)
     if r.status_code != 200: raise AlertError(r.status_code, r.text)
     logger.debug(r)
 
@@ -174,6 +183,6 @@ def gotify_send(message: str) -> None:
         'message': (None, f'{message}'),
         'priority': (None, '5'),
     }
-    r = requests.post(url, params=params, files=files)
+    r = _session.post(url, params=params, files=files, timeout=settings.ALERT_TIMEOUT)
     if r.status_code != 200: raise AlertError(r.status_code, r.text)
     logger.debug(r)
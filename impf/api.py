@@ -1,13 +1,19 @@
 from base64 import b64encode
 from dataclasses import dataclass, field
-from time import sleep
-from typing import Any, List, Dict, Union
+from time import sleep, time
+from typing import Any, Callable, List, Dict, Union
 from urllib.parse import urlparse
 import logging
 
 import requests
-from requests.sessions import Session
 import settings
+from impf import events, transport
+from impf.alert import send_alert
+from impf.inbox import read_backend
+from impf.policy import pick
+from impf.profiles import Profile, default, subscribers
+from impf.constructors import format_appointments, server_id
+from impf.cookies import jar
 from impf.exceptions import AdvancedSessionError, AdvancedSessionCache
 from impf.decorators import api_call, next_gen
 
@@ -24,11 +30,11 @@ HEADERS = {
 class AdvancedSession:
     session = None
     error_counter = 0
+    last_429 = 0  # Timestamp of the last `429` response
     logger: 'logger' = field(init=False)
 
     def __post_init__(self):
-        self.session = Session()
-        self.session.headers.update(HEADERS)
+        self.session = transport.session(HEADERS)
         self.logger = settings.LocationAdapter(logger, {'location': 'API'})
 
     @api_call
@@ -44,11 +50,13 @@ class AdvancedSession:
         if self.error_counter >= 3:
             raise AdvancedSessionError(-1, 'Maximum retries exceeded')
         elif code == 429:
+            wait = 'for the circuit breaker' if settings.CIRCUIT_BREAKER_ENABLED else f'{settings.WAIT_API_CALLS // 60}min'
             self.logger.warning('[429] The server is experiencing too many requests – either from our IP or generally. '
-                           f'Waiting {settings.WAIT_API_CALLS // 60}min before trying again')
+                                f'Waiting {wait} before trying again')
             self.logger.warning('It is highly recommended to avoid any further activity and stop '
                                 'requesting ImpfterminService during that time')
-            sleep(settings.WAIT_API_CALLS)
+            # Otherwise the circuit breaker / penalized rate limit delays the retry
+            if not (settings.CIRCUIT_BREAKER_ENABLED or settings.RATE_LIMIT_ENABLED): sleep(settings.WAIT_API_CALLS)
         elif code >= 400:
             if message:
                 if message.get('errors'):
@@ -72,13 +80,19 @@ class API:
     logger: 'logger' = field(init=False)
     _zip_code: str = ''
     _code: str = ''
+    _generation: int = 0  # Generation of the shared cookies in use
+    cookie_source: Callable[['API'], List[dict]] = None  # Fresh cookies without attached browser; see aio
 
     def __post_init__(self):
         self.xs = AdvancedSession()
         if self.driver is not None:
             _host = urlparse(self.driver.driver.current_url)
-            self.host = f'{_host.scheme}://{_host.hostname}'
-            self.xs.session.cookies.update({c['name']: c['value'] for c in self.driver.driver.get_cookies()})
+            self.host = f'{_host.scheme}://{_host.netloc}'
+            cookies = self.driver.driver.get_cookies()
+            self.xs.session.cookies.update({c['name']: c['value'] for c in cookies})
+            self._generation = jar.store(self.server_id, cookies)
+        elif self.host:
+            self.load_cookies()
         self.logger = settings.LocationAdapter(logger, {'location': 'API'})
         if not self.cookies_complete:
             self.logger.info('Caution! You might not have all cookies to issue requests!')
@@ -125,6 +139,10 @@ class API:
             return
         self._code = value
 
+    @property
+    def server_id(self) -> str:
+        return server_id(self.host)
+
     @property
     def cookies_complete(self) -> bool:
         cookies = ['bm_sz', 'ak_bmsc' , '_abck', 'bm_sv', 'akavpau_User_allowed']  # bm_mi
@@ -134,28 +152,55 @@ class API:
 
     @staticmethod
     def zip_center(zip_code: str) -> Union[dict, None]:
-        """ Returns the information of a center given a zip code -
-         should probably be at the bottom of the file """
-        r = requests.get('https://www.impfterminservice.de/assets/static/impfzentren.json', headers=HEADERS, timeout=10)
-        if not r.status_code == 200 or not r.json(): return
-        centers = r.json().get(settings.BUNDESLAND)
-        center = [center for center in centers if center.get('PLZ') == zip_code]
-        return next(iter(center), '')
+        """ Returns the information of a center given a zip code """
+        from impf.centers import catalog
+        return catalog.zip(zip_code)
 
     def auth(self) -> None:
         """ Sets Authorization Header """
-        self.xs.session.headers.update({
-            'Authorization': f'Basic {b64encode(f":{self.code}".encode("utf-8")).decode("utf-8")}',
-            'Referer': f'{self.host}/impftermine/suche/{self.code}/{self.zip_code}'
-        })
+        self.xs.session.headers.update(self.auth_headers(self.code))
+
+    def auth_headers(self, code: str) -> Dict[str, str]:
+        return {
+            'Authorization': f'Basic {b64encode(f":{code}".encode("utf-8")).decode("utf-8")}',
+            'Referer': f'{self.host}/impftermine/suche/{code}/{self.zip_code}'
+        }
+
+    def load_cookies(self) -> bool:
+        """ Loads still valid cookies of our server from the shared cookie store """
+        cookies, generation = jar.get(self.server_id)
+        if not cookies: return False
+        self.xs.session.cookies.update(cookies)
+        self._generation = generation
+        return True
 
     def refresh_cookies(self) -> None:
-        from .browser import Browser
-        x = Browser(location=self.zip_code, code=self.code)
-        x.main_page()
-        x.location_page()
-        self.xs.session.cookies.update({c['name']: c['value'] for c in x.driver.get_cookies()})
-        x.driver.quit()
+        """ Refreshes cookies – only one refresh per server at a time; if another worker already
+        refreshed them, those are reused. Otherwise reuses the attached browser (hybrid polling)
+        if available, asks `cookie_source` or spawns a dedicated one """
+        with jar.lock(self.server_id):
+            _, generation = jar.get(self.server_id)
+            if generation != self._generation and self.load_cookies():
+                self.logger.info(f'Reusing cookies refreshed by another worker for server [{self.server_id}]')
+                return
+
+            if self.driver is not None:
+                self.logger.info('Handing back to browser to refresh session cookies')
+                self.driver.driver.get(f'{self.host}/impftermine/suche/{self.code}/{self.zip_code}')
+                self.driver.waiting_room()
+                cookies = self.driver.driver.get_cookies()
+            elif self.cookie_source is not None:
+                cookies = self.cookie_source(self)
+            else:
+                from .browser import Browser
+                x = Browser(location=self.zip_code, code=self.code)
+                x.main_page()
+                x.location_page()
+                cookies = x.driver.get_cookies()
+                x.driver.quit()
+
+            self.xs.session.cookies.update({c['name']: c['value'] for c in cookies})
+            self._generation = jar.store(self.server_id, cookies)
 
     def set_cookies(self, cookies: str) -> None:
         """ Sets cookies from browser header string """
@@ -228,31 +273,28 @@ class API:
         params = {
             'plz': self.zip_code
         }
-        return self.xs.get(f'{self.host}/rest/suche/impfterminsuche', params=params).json()
+        appointments = self.xs.get(f'{self.host}/rest/suche/impfterminsuche', params=params).json()
+        termine = len(appointments.get('termine') or [])
+        outcome = events.APPOINTMENTS if termine else events.NO_APPOINTMENTS
+        events.record(self.zip_code, self.server_id, outcome, termine)
+        if self.driver is not None: self.driver.checked = (self.server_id, outcome)
+        return appointments
 
     @next_gen
-    def book_appointment(self, appointments: Dict, idx: int) -> bool:
-        """ Bucht Appointment mit Index idx-1 """
-        self.logger.info(f'Booking appointment for {self.zip_code}')
+    def book_appointment(self, appointments: Dict, idx: int, profile: Profile = None, code: str = '') -> bool:
+        """ Bucht Appointment mit Index idx-1 für `profile` (Standard: Daten aus settings.py)
+        mit dessen Vermittlungscode `code` """
+        profile = profile or default()
+        self.logger.info(f'Booking appointment for {self.zip_code}' + (f' ({profile.name})' if settings.PROFILES else ''))
 
         data = {
             'slots': [termin.get("slotId") for termin in appointments.get('termine')[idx-1]],
             'qualifikationen': appointments.get('gesuchteLeistungsmerkmale'),
             'plz': self.zip_code,
-            'contact': {
-                'anrede': settings.SALUTATION,
-                'vorname': settings.FIRST_NAME,
-                'nachname': settings.LAST_NAME,
-                'strasse': settings.STREET_NAME,
-                'hausnummer': settings.HOUSE_NUMBER,
-                'plz': settings.ZIP_CODE,
-                'ort': settings.CITY,
-                'phone': f'+49 {settings.PHONE}',
-                'notificationReceiver': settings.MAIL,
-                'notificationChannel': 'email'
-            },
+            'contact': profile.contact,
         }
-        r = self.xs.post(f'{self.host}/rest/buchung', json=data)
+        headers = self.auth_headers(code) if code and code != self.code else None
+        r = self.xs.post(f'{self.host}/rest/buchung', json=data, headers=headers)
 
         if r.status_code == 481:
             self.logger.info('Code was already used to book an appointment')
@@ -263,10 +305,79 @@ class API:
 
     def control_appointments(self) -> dict:
         """ Hilfsfunktion um Appointments via REST API vom Backend zu laden """
+        started = time()
         try:
             self.auth()
             appointments = self.get_appointments()
         except:
             self.logger.exception('An exception occurred while loading appointments via REST API!')
             appointments = []
+        if self.driver is not None and self.xs.last_429 >= started:
+            self.driver.checked = (self.server_id, events.TOO_MANY_REQUESTS)
         return appointments
+
+    def confirm_booking(self, appointments: Dict, fappointments: List[str], idx: int,
+                        fallback: Callable[[int], bool] = None, profile: Profile = None, code: str = '') -> bool:
+        """ Bucht Appointment `idx` und bestätigt die Buchung via Alert; gibt zurück, ob gebucht wurde """
+        if self.book_appointment(appointments, idx, profile, code) or (fallback and fallback(idx)):
+            appointment = fappointments[idx - 1].replace("* ", "").replace(f' (appt:{idx})', '')
+            booked_for = f' for {profile.name}' if profile and settings.PROFILES else ''
+            send_alert(f'Successfully booked appointment "**{appointment}**"{booked_for} – check your mails!  \n'
+                       f'Thanks for using RAUSYS Technologies :)  \n'
+                       f'Feedback is highly appreciated: '
+                       f'https://github.com/alfonsrv/impf-botpy/issues/1 and only takes 2 seconds!')
+            self.logger.info('Booking confirmed! Feedback is highly appreciated: '
+                             'https://github.com/alfonsrv/impf-botpy/issues/1 and only takes 2 seconds!')
+            return True
+        booked_for = f' for {profile.name}' if profile and settings.PROFILES else ''
+        self.logger.error(f'Did not get <201 Created> from server booking appointment {idx}{booked_for}')
+        send_alert(f'Booking appointment {idx}{booked_for} failed – please continue manually!')
+        return False
+
+    def remote_booking(self, fallback: Callable[[int], bool] = None) -> None:
+        """ Hilfsfunktion um Termine Remote zu buchen – wartet auf max 10 Minuten
+        auf User Input via Chat App und fährt dann fährt dann fort; `fallback`
+        bucht den Termin alternativ (bspw. via Browser). Mit PROFILES wird
+        nacheinander für jedes Profil mit Code für die Location gebucht """
+        appointments = self.control_appointments()
+
+        if not appointments:
+            self.logger.warning('BOOK_REMOTELY enabled, but appointments empty! Please continue manually')
+            send_alert('Booking remotely enabled, but didn\'t get appointments from backend. Please continue manually!')
+            return
+
+        termine = list(appointments.get('termine') or [])
+        for profile, code in subscribers(self.zip_code, self.code) or [(default(), self.code)]:
+            if not termine:
+                self.logger.warning(f'No appointments left to book for {profile.name}')
+                send_alert(f'No appointments left to book for {profile.name} – please continue manually!')
+                return
+            # The browser only books for the profile in settings.py with the code it's using
+            _fallback = fallback if code == self.code and profile.primary else None
+            idx = self.profile_booking({**appointments, 'termine': termine}, profile, code, _fallback)
+            if idx: termine.pop(idx - 1)
+
+    def profile_booking(self, appointments: Dict, profile: Profile, code: str,
+                        fallback: Callable[[int], bool] = None) -> int:
+        """ Bucht einen Termin für `profile` – gemäß AUTO_BOOK_RULES oder Auswahl via Chat App;
+        gibt den gebuchten Index zurück (0, wenn nicht gebucht wurde) """
+        fappointments = format_appointments(appointments.get('termine'))
+        if settings.AUTO_BOOK:
+            idx = pick(appointments.get('termine'), self.zip_code)
+            if idx:
+                self.logger.warning(f'AUTO_BOOK - appointment {idx} matches AUTO_BOOK_RULES - booking now...')
+                return idx if self.confirm_booking(appointments, fappointments, idx, fallback, profile, code) else 0
+            self.logger.info('AUTO_BOOK - no appointment matches AUTO_BOOK_RULES')
+            if not settings.BOOK_REMOTELY: return 0
+
+        bookings = settings.ALERT_BOOKINGS.replace('{{ APPOINTMENTS }}', '  \n'.join(fappointments))
+        send_alert(f'{profile.name}: {bookings}' if settings.PROFILES else bookings)
+
+        _code = read_backend('appt', self.zip_code, settings.WAIT_SMS_MANUAL)
+        if _code:
+            self.logger.warning(f'Received Appointment indicator from backend: {_code} - booking now...')
+            idx = int(_code)
+            return idx if self.confirm_booking(appointments, fappointments, idx, fallback, profile, code) else 0
+
+        self.logger.warning('No Appointment indicator received from backend')
+        return 0
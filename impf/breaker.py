@@ -0,0 +1,85 @@
+""" Process-wide circuit breaker per server id – a `429` opens the circuit and pauses every
+browser's and API session's requests to that server; after the cooldown a single probe
+request is let through (half-open) and its outcome closes the circuit or opens it again
+with a doubled cooldown, so one ban isn't prolonged by the rest of the fleet """
+import logging
+from dataclasses import dataclass, field
+from threading import Condition, Lock
+from time import time
+from typing import Dict
+
+import settings
+from impf import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+PROBE_TIMEOUT = 60*5  # Seconds after which a probe that never reported back is given up on
+
+
+@dataclass
+class CircuitBreaker:
+    server: str
+    cooldown: float  # Seconds the circuit stays open after the first `429`
+    maximum: float  # Upper limit of the doubled cooldown
+    state: str = field(init=False, default=CLOSED)
+    _wait: float = field(init=False, default=0)  # Current cooldown
+    _opened: float = field(init=False, default=0)
+    _probing: float = field(init=False, default=0)  # Start of the probe in flight
+    _condition: Condition = field(init=False, default_factory=Condition)
+
+    def remaining(self) -> float:
+        """ Seconds until the circuit will be half-open """
+        if self.state != OPEN: return 0
+        return max(0, self._opened + self._wait - time())
+
+    def acquire(self) -> float:
+        """ Blocks while the circuit is open or another worker's probe is in flight;
+        returns seconds waited """
+        started = time()
+        with self._condition:
+            while True:
+                if self.state == CLOSED: break
+                if self.state == OPEN and self.remaining():
+                    self._condition.wait(self.remaining())
+                    continue
+                if self.state == OPEN or time() - self._probing > PROBE_TIMEOUT:
+                    self.state, self._probing = HALF_OPEN, time()
+                    logger.info(f'Server [{self.server}] circuit half-open - sending probe request')
+                    break
+                self._condition.wait(PROBE_TIMEOUT)
+        return time() - started
+
+    def record(self, too_many_requests: bool) -> None:
+        with self._condition:
+            if too_many_requests:
+                if self.state == HALF_OPEN: self._wait = min(self.maximum, self._wait * 2)
+                elif self.state == OPEN: self._wait = max(self._wait, self.cooldown)  # Straggler of another worker
+                else: self._wait = self.cooldown
+                if self.state != OPEN:
+                    metrics.inc('impf_circuit_opened_total', server=self.server)
+                    logger.warning(f'Server [{self.server}] returned `429` - pausing all requests to it '
+                                   f'for {int(self._wait) // 60}min')
+                self.state, self._opened = OPEN, time()
+            elif self.state == HALF_OPEN:
+                logger.info(f'Server [{self.server}] answered probe request - resuming requests')
+                self.state = CLOSED
+            self._condition.notify_all()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_lock = Lock()
+
+
+def breaker(server: str) -> CircuitBreaker:
+    """ Returns the circuit breaker of a server id (001, 002, ...) """
+    with _lock:
+        if server not in _breakers:
+            _breakers[server] = CircuitBreaker(
+                server=server,
+                cooldown=settings.CIRCUIT_BREAKER_COOLDOWN,
+                maximum=settings.CIRCUIT_BREAKER_MAXIMUM
+            )
+        return _breakers[server]
@@ -1,27 +1,51 @@
 import json
+from collections import deque
 from dataclasses import dataclass, field
 from time import sleep, time
-from typing import List, Tuple
+from typing import Deque, List, Tuple, Union
 
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException, \
-    ElementNotInteractableException
+    ElementNotInteractableException, WebDriverException
 from selenium.webdriver import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 import settings
-from impf.alert import send_alert, read_backend
+from impf.alert import send_alert
+from impf.inbox import read_backend
 
 import logging
 
 from impf.api import API
-from impf.constructors import browser_options, format_appointments
-from impf.decorators import shadow_ban, control_errors
+from impf.constructors import browser_options, devtools_setup, server_id, service_url, OBSERVE_SCRIPT
+from impf import events, metrics
+from impf.decorators import shadow_ban, control_errors, timed
+from impf.exceptions import WorkflowRestart
+from impf.limiter import pace, feedback
+from impf.locations import LOCATIONS_PATH
+from impf.slots import tracker
+from impf.state import state
 
 logger = logging.getLogger(__name__)
 
+WAITING_ROOM = '//h1[text()="Virtueller Warteraum des Impfterminservice"]'
+LOADING_VACANCY = '//div[contains(text(),"Bitte warten, wir suchen")]'
+NETWORK_LOG_SIZE = 256  # HTTP responses kept per browser
+VACANCY_ATTEMPTS = 3  # Times to wait WAIT_BROWSER_MAXIMUM for the vacancy to load before restarting
+HYBRID_FAILURES = 3  # Failed REST API searches in a row before restarting the workflow
+
+# Workflow states – each control function returns the next state; None ends the workflow
+START, VERMITTLUNGSCODE, SMS, APPOINTMENT, HYBRID = 'start', 'vermittlungscode', 'sms', 'appointment', 'hybrid'
+# States to continue with, given the current page title (<h1>)
+MAIN_TITLE = 'Buchen Sie die Termine für Ihre Corona-Schutzimpfung'
+TITLES = {
+    'Wurde Ihr Anspruch auf eine Corona-Schutzimpfung bereits geprüft?': VERMITTLUNGSCODE,
+    'Vermittlungscode anfordern': SMS,
+    'Onlinebuchung für Ihre Corona-Schutzimpfung': APPOINTMENT,
+}
+
 
 @dataclass
 class Browser:
@@ -33,6 +57,11 @@ class Browser:
     keep_browser: bool = False  # Helper variable to indicate whether or not to keep browser open for reuse
     error_counter: int = 0  # Helper variable to avoid infinite loop
     logger: logger = field(init=False)  # Internal adapter-logger to add PLZ field
+    api: API = field(init=False, default=None)  # REST session handed over to the asyncio engine
+    zip_codes: List[str] = field(default_factory=list)  # Centers on the same server to search with our code
+    network: Deque[Tuple[float, int, str]] = field(init=False)  # Recent HTTP responses (timestamp, status, url)
+    last_429: float = field(init=False, default=0)  # Timestamp of the last `429` response
+    checked: Tuple[str, str] = field(init=False, default=('', ''))  # Server and outcome of the current check
 
     def __post_init__(self):
         opts = browser_options()
@@ -40,8 +69,11 @@ class Browser:
             self.driver = webdriver.Chrome(settings.SELENIUM_PATH, options=opts)
         else:
             self.driver = webdriver.Chrome(options=opts)
+        devtools_setup(self.driver)
         self.driver.implicitly_wait(settings.WAIT_BROWSER_MAXIMUM // 4 or 2.5)
         self.wait = WebDriverWait(self.driver, settings.WAIT_BROWSER_MAXIMUM)
+        self.network = deque(maxlen=NETWORK_LOG_SIZE)
+        self.last_429 = 0
         self.logger = settings.LocationAdapter(logger, {'location': self.location[:5]})
 
     def reset(self, *args, **kwargs):
@@ -50,17 +82,32 @@ class Browser:
         self.driver.quit()
         self.__post_init__()
         self.error_counter = 0
-        return self.control_main()
+        return START
+
+    def restart(self) -> str:
+        """ Helper function to restart the workflow from the main page """
+        return START
 
     def reinit(self, *args, **kwargs):
         """ Hacky Helper function to reinitialize
         Browser with new data - sorry """
         self.location = kwargs.get('location')
         self.code = kwargs.get('code')
+        self.zip_codes = kwargs.get('zip_codes') or []
         self.error_counter = 0
         self.location_full = ''
+        self.api = None
+        self.checked = ('', '')
         self.logger = settings.LocationAdapter(logger, {'location': self.location[:5]})
 
+    @property
+    def alive(self) -> bool:
+        """ Health check – is the browser still reachable? """
+        try:
+            return self.driver.current_url is not None
+        except WebDriverException:
+            return False
+
     @property
     def in_waiting_room(self) -> bool:
         """ Momentan im Warteraum? """
@@ -70,7 +117,7 @@ class Browser:
     @property
     def server_id(self) -> str:
         """ Returns the server identifier we're connected to (001, 002, ...) """
-        return self.driver.current_url[8:11]
+        return server_id(self.driver.current_url)
 
     @property
     def has_vacancy(self) -> bool:
@@ -106,7 +153,9 @@ class Browser:
         """ Check ob Vermittlungscode an sich ok, aber auf Error gelaufen ist; bspw.
          wegen zu vielen Anfragen (429) """
         try:
-            sleep(1.5)
+            # Either an error is shown or we proceed to the booking page
+            self.observe('//div[contains(@class, "kv-alert-danger")] | '
+                         '//h1[text()="Onlinebuchung für Ihre Corona-Schutzimpfung"]')
             element = self.driver.find_element_by_xpath('//div[contains(@class, "kv-alert-danger")]')
             # interner Fehler x unerwarteter Fehler
             return 'Fehler' in element.text
@@ -135,25 +184,61 @@ class Browser:
     def loading_vacancy(self) -> bool:
         """ Prüft ob Verfügbarkeit noch geladen wird """
         try:
-            element = self.driver.find_element_by_xpath('//div[contains(text(),"Bitte warten, wir suchen")]')
+            element = self.driver.find_element_by_xpath(LOADING_VACANCY)
             return bool(element)
         except NoSuchElementException:
             return False
 
-    @property
-    def too_many_requests(self) -> bool:
-        """ Checks if we're being blocked; unfortunately there is no better way, as
-        Selenium doesn't allow us to check HTTP status codes in the Network tab """
-        relevant = time() - 120
+    def rate_limited(self, since: float) -> bool:
+        """ Checks if the server responded with `429` since timestamp `since` """
+        try:
+            self.drain_network()
+        except WebDriverException:
+            return self.console_rate_limited(since)
+        return self.last_429 >= since
+
+    def drain_network(self) -> None:
+        """ Moves HTTP responses from Chrome's DevTools performance log into the ring buffer """
+        for entry in self.driver.get_log('performance'):
+            message = json.loads(entry.get('message')).get('message', {})
+            if message.get('method') != 'Network.responseReceived': continue
+            response = message.get('params', {}).get('response', {})
+            timestamp = entry.get('timestamp') / 1000
+            self.network.append((timestamp, response.get('status'), response.get('url')))
+            if response.get('status') == 429: self.last_429 = max(self.last_429, timestamp)
+
+    def console_rate_limited(self, since: float) -> bool:
+        """ Fallback if the performance log is unavailable – unfortunately lossy, as
+        only failed requests are logged to the console """
         sleep(1.5)  # give browser time to catch-up
         for log in self.driver.get_log('browser'):
             if log.get('level') == 'SEVERE' \
                     and log.get('source') == 'network' \
-                    and (log.get('timestamp') / 1000) > relevant \
+                    and (log.get('timestamp') / 1000) > since \
                     and '429' in log.get('message'):
                 return True
         return False
 
+    def observe(self, xpath: str, present: bool = True, timeout: float = 0) -> bool:
+        """ Waits until an element matching `xpath` is (not) present – resolved by an injected
+        MutationObserver the moment the DOM changes instead of sleeping for a fixed time """
+        timeout = timeout or settings.WAIT_BROWSER_MAXIMUM
+        try:
+            self.driver.set_script_timeout(timeout + 5)
+            return bool(self.driver.execute_async_script(OBSERVE_SCRIPT, xpath, present, int(timeout * 1000)))
+        except TimeoutException:
+            return False
+        except WebDriverException as e:
+            # Page navigated while observing – a dead browser is handled by control_errors
+            if 'chrome not reachable' in str(e): raise
+            return False
+
+    def record(self, outcome: str) -> None:
+        """ Records the outcome of the current check in the event store """
+        server = self.server_id
+        self.checked = (server, outcome)
+        events.record(self.location[:5], server, outcome)
+
     def cookie_popup(self) -> None:
         try:
             button = self.driver.find_element_by_xpath('//a[contains(text(), "Auswahl bestätigen")]')
@@ -170,12 +255,13 @@ class Browser:
         self.logger.debug(f'sessionStorage.setItem("ets-session-its-cv-quick-check", "{payload}");')
         self.driver.execute_script(f'sessionStorage.setItem("ets-session-its-cv-quick-check", \'{payload}\');')
 
+    @timed
     def main_page(self) -> None:
         self.logger.info('Navigating to ImpfterminService')
-        self.driver.get('https://www.impfterminservice.de/impftermine')
+        self.driver.get(f'{service_url()}/impftermine')
         elements = self.wait.until(EC.presence_of_all_elements_located((By.XPATH, '//span[@role="combobox"]')))
         title = self.driver.find_element_by_xpath('//h1')
-        assert title.text == 'Buchen Sie die Termine für Ihre Corona-Schutzimpfung'
+        assert title.text == MAIN_TITLE
         self.cookie_popup()
 
         # Load Bundesländer
@@ -198,18 +284,20 @@ class Browser:
         submit.click()
         sleep(.5)
 
+    @timed
     def waiting_room(self):
         if not self.in_waiting_room: return
         self.logger.info('Taking a seat in the waiting room (very german)')
-        while self.in_waiting_room: sleep(5)
+        while self.in_waiting_room: self.observe(WAITING_ROOM, present=False, timeout=60)
         self.logger.info('No longer in waiting room!')
 
     @shadow_ban
+    @timed
     def location_page(self) -> None:
         title = self.wait.until(EC.presence_of_element_located((By.XPATH, '//h1')))
         assert title.text == 'Wurde Ihr Anspruch auf eine Corona-Schutzimpfung bereits geprüft?'
         self.cookie_popup()
-        sleep(3)
+        self.observe('//a[contains(text(), "Auswahl bestätigen")]', present=False)
         claim = 'Ja' if self.code else 'Nein'
         element = self.wait.until(EC.presence_of_element_located(
             (By.XPATH,
@@ -224,8 +312,10 @@ class Browser:
         action.move_by_offset(10, 5).perform()
 
         # Ensure vacancy has fully loaded before proceeding
-        while self.loading_vacancy and claim == 'Nein':
-            sleep(2.5)
+        if claim == 'Ja': return
+        for _ in range(VACANCY_ATTEMPTS):
+            if self.observe(LOADING_VACANCY, present=False): return
+        raise WorkflowRestart('Vacancy did not finish loading')
 
     def confirm_eligible(self) -> None:
         """ Termin verfügbar; prüfe ob Termine für unser Alter """
@@ -269,72 +359,44 @@ class Browser:
         oder manuell einzugeben. Wartet max. 10 Minuten, und fährt dann fährt dann fort """
         self.logger.warning('Enter SMS code! Waiting for user input.')
         send_alert(settings.ALERT_SMS.replace('{{ LOCATION }}', self.location_full))
-        start = time()
-        while (time() - start) < settings.WAIT_SMS_MANUAL:
-            _code = read_backend('sms')
-            if _code:
-                self.logger.warning(f'Received Code from backend: {_code} - entering now...')
-                send_alert(f'Entering code "{_code}"; check your mails!  \n'
-                           f'Thanks for using RAUSYS Technologies :)')
-                return _code
-            sleep(15)
+        _code = read_backend('sms', self.location[:5], settings.WAIT_SMS_MANUAL)
+        if _code:
+            self.logger.warning(f'Received Code from backend: {_code} - entering now...')
+            send_alert(f'Entering code "{_code}"; check your mails!  \n'
+                       f'Thanks for using RAUSYS Technologies :)')
+            return _code
         self.logger.warning('No SMS code received from backend')
 
-    def alert_appointment(self) -> None:
+    def alert_appointment(self, api: API = None, seen: float = None, changes: str = '') -> None:
         """ Benachrichtigung User - um entweder Termin via ext. Plattform (Zulip, ...) zu buchen
-        oder manuell einzugeben. Kritischste Funktion – max. Exception-Verschachtelung """
+        oder manuell einzugeben. Kritischste Funktion – max. Exception-Verschachtelung;
+        `seen` ist der Zeitpunkt, zu dem die Termine gefunden wurden; `changes` die neuen
+        bzw. weggefallenen Termine seit dem letzten Alert """
         self.logger.warning('Available appointments! Waiting for user input')
         alert = settings.ALERT_AVAILABLE\
             .replace('{{ LOCATION }}', self.location_full)\
             .replace('{{ LINK }}', self.driver.current_url)
-        send_alert(alert)
+        if changes: alert = f'{alert}  \n{changes}'
+        metrics.track_alert(send_alert(alert), seen or time(), location=self.location[:5], server=self.server_id)
         self.keep_browser = True
 
-        if not settings.BOOK_REMOTELY:
+        if not (settings.BOOK_REMOTELY or settings.AUTO_BOOK):
             self.logger.warning('Exiting in 10 minutes, our job here is done. Keeping browser open.')
             return
 
         try:
-            self.remote_booking()
+            self.remote_booking(api)
         except:
             self.logger.exception('Unexpected exception occurred trying to book appointments remotely!')
             send_alert('Appointment could not be booked – please continue manually!')
 
-    def remote_booking(self) -> None:
-        """ Hilfsfunktion um Termine Remote zu buchen – wartet auf max 10 Minuten
-        auf User Input via Chat App und fährt dann fährt dann fort """
-        # Booking remotely - should probably be a dedicated function
-        api = API(driver=self)
-        appointments = api.control_appointments()
-
-        if not appointments:
-            self.logger.warning('BOOK_REMOTELY enabled, but appointments empty! Please continue manually')
-            send_alert('Booking remotely enabled, but didn\'t get appointments from backend. Please continue manually!')
-            return
-
-        fappointments = format_appointments(appointments.get('termine'))
-        send_alert(settings.ALERT_BOOKINGS.replace('{{ APPOINTMENTS }}', '  \n'.join(fappointments)))
-
-        start = time()
-        while (time() - start) < settings.WAIT_SMS_MANUAL:
-            _code = read_backend('appt')
-            if _code:
-                self.logger.warning(f'Received Appointment indicator from backend: {_code} - booking now...')
-                if api.book_appointment(appointments, int(_code)) or self.book_appointment(int(_code)):
-                    appointment = fappointments[int(_code) - 1].replace("* ", "").replace(f' (appt:{_code})', '')
-                    send_alert(f'Successfully booked appointment "**{appointment}**" – check your mails!  \n'
-                               f'Thanks for using RAUSYS Technologies :)  \n'
-                               f'Feedback is highly appreciated: '
-                               f'https://github.com/alfonsrv/impf-botpy/issues/1 and only takes 2 seconds!')
-                    self.logger.info('Booking confirmed! Feedback is highly appreciated: '
-                                     'https://github.com/alfonsrv/impf-botpy/issues/1 and only takes 2 seconds!')
-                    return
-                raise Exception('Did not get <201 Created> from server')
-            sleep(15)
-
-        self.logger.warning('No Appointment indicator received from backend')
+    def remote_booking(self, api: API = None) -> None:
+        """ Hilfsfunktion um Termine Remote zu buchen – Browser dient als Fallback,
+        falls die Buchung via REST API fehlschlägt """
+        (api or API(driver=self)).remote_booking(fallback=self.book_appointment)
 
     @shadow_ban
+    @timed
     def fill_code(self) -> None:
         """ Vermittlungscode für Location eingeben und prüfen """
         title = self.wait.until(EC.presence_of_element_located((By.XPATH, '//h1')))
@@ -350,6 +412,7 @@ class Browser:
         submit.click()
 
     @shadow_ban
+    @timed
     def search_appointments(self) -> bool:
         """ Suche Termine mit Vermittlungscode """
         title = self.wait.until(EC.presence_of_element_located((By.XPATH, '//h1')))
@@ -363,16 +426,21 @@ class Browser:
             self.logger.debug('Could not find "Abbrechen" button - this usually happens when you are running in a slow '
                               'environment such as Docker or if the ImpfterminService site has changed.')
 
-        try:
-            submit = self.wait.until(EC.element_to_be_clickable((By.XPATH, '//button[contains(text(), "Termine suchen")]')))
-            submit.click()
-            sleep(2.5)
-
-        # Docker seems to have consistent runtime errors
-        except ElementClickInterceptedException:
-            self.logger.info('Could not click "Termine suchen" button - this usually happens when you are running in a slow '
-                             'environment such as Docker or if the ImpfterminService site has changed.')
-            return self.search_appointments()
+        for _ in range(3):
+            try:
+                submit = self.wait.until(EC.element_to_be_clickable((By.XPATH, '//button[contains(text(), "Termine suchen")]')))
+                submit.click()
+                self.observe('//span[@class="its-slot-pair-search-no-results"] | '
+                             '//span[contains(@class, "text-pre-wrap") and contains(text(), "Fehler")] | '
+                             '//*[contains(text(), "1. Impftermin")]')
+                break
+
+            # Docker seems to have consistent runtime errors
+            except ElementClickInterceptedException:
+                self.logger.info('Could not click "Termine suchen" button - this usually happens when you are running in a slow '
+                                 'environment such as Docker or if the ImpfterminService site has changed.')
+        else:
+            return False
 
         try:
             if self.driver.find_element_by_xpath('//span[@class="its-slot-pair-search-no-results"]') \
@@ -388,53 +456,58 @@ class Browser:
         except NoSuchElementException: element = None
         return bool(element)
 
+    @timed
     def book_appointment(self, appointment: int) -> bool:
         """ Bucht Termin <appointment> via Browser mit den in settings.py spezifizierten
         personenbezogenen Daten – Funktion dient als Fallback (shoutout github/timoknapp) """
 
-        # Step 1 – Select Appointment
-        elements = self.wait.until(EC.presence_of_all_elements_located((By.XPATH, '//input[@type="radio" and @formcontrolname="slotPair"]//following-sibling::div[contains(@class,"its-slot-pair-search-slot-wrapper")]/..')))
-        # Select appointment ID user submitted via backend
-        elements[appointment-1].click()
-
-        try:
-            submit = self.wait.until(EC.element_to_be_clickable((By.XPATH, f'//button[@type="submit" and contains(text(), "AUSWÄHLEN")]')))
-            submit.click()
-        except:
-            # Button not clickable – timer likely expired due to racing condition; attempting to recover automatically
-            self.search_appointments()
-            return self.book_appointment()
-
-        # Step 2 – Input Data
-        element = self.wait.until(EC.presence_of_element_located((By.XPATH, f'//button[contains(text(), "Daten erfassen")]')))
-        element.click()
-
-        salutation = self.wait.until(EC.presence_of_element_located((By.XPATH, f'//input[@type="radio" and @name="salutation"]//following-sibling::span[contains(text(), "{settings.SALUTATION}")]/..')))
-        salutation.click()
-
-        enter_form = lambda elem, id: self.wait.until(EC.presence_of_element_located((By.XPATH, f'//input[@formcontrolname="{elem}"]'))).send_keys(getattr(settings, id))
-        enter_form('firstname', 'FIRST_NAME')
-        enter_form('lastname', 'LAST_NAME')
-        enter_form('zip', 'ZIP_CODE')
-        enter_form('city', 'CITY')
-        enter_form('street', 'STREET_NAME')
-        enter_form('housenumber', 'HOUSE_NUMBER')
-        enter_form('phone', 'PHONE')
-        enter_form('notificationReceiver', 'MAIL')
+        for _ in range(3):
+            # Step 1 – Select Appointment
+            elements = self.wait.until(EC.presence_of_all_elements_located((By.XPATH, '//input[@type="radio" and @formcontrolname="slotPair"]//following-sibling::div[contains(@class,"its-slot-pair-search-slot-wrapper")]/..')))
+            # Select appointment ID user submitted via backend
+            elements[appointment-1].click()
+
+            try:
+                submit = self.wait.until(EC.element_to_be_clickable((By.XPATH, f'//button[@type="submit" and contains(text(), "AUSWÄHLEN")]')))
+                submit.click()
+            except:
+                # Button not clickable – timer likely expired due to racing condition; attempting to recover automatically
+                self.search_appointments()
+                continue
+
+            # Step 2 – Input Data
+            element = self.wait.until(EC.presence_of_element_located((By.XPATH, f'//button[contains(text(), "Daten erfassen")]')))
+            element.click()
 
-        try:
-            submit = self.wait.until(EC.element_to_be_clickable((By.XPATH, f'//button[@type="submit" and contains(text(), "Übernehmen")]')))
-            submit.click()
-        except:
-            # Button not clickable – timer likely expired due to racing condition; attempting to recover automatically
-            self.search_appointments()
-            return self.book_appointment()
+            salutation = self.wait.until(EC.presence_of_element_located((By.XPATH, f'//input[@type="radio" and @name="salutation"]//following-sibling::span[contains(text(), "{settings.SALUTATION}")]/..')))
+            salutation.click()
+
+            enter_form = lambda elem, id: self.wait.until(EC.presence_of_element_located((By.XPATH, f'//input[@formcontrolname="{elem}"]'))).send_keys(getattr(settings, id))
+            enter_form('firstname', 'FIRST_NAME')
+            enter_form('lastname', 'LAST_NAME')
+            enter_form('zip', 'ZIP_CODE')
+            enter_form('city', 'CITY')
+            enter_form('street', 'STREET_NAME')
+            enter_form('housenumber', 'HOUSE_NUMBER')
+            enter_form('phone', 'PHONE')
+            enter_form('notificationReceiver', 'MAIL')
+
+            try:
+                submit = self.wait.until(EC.element_to_be_clickable((By.XPATH, f'//button[@type="submit" and contains(text(), "Übernehmen")]')))
+                submit.click()
+            except:
+                # Button not clickable – timer likely expired due to racing condition; attempting to recover automatically
+                self.search_appointments()
+                continue
+
+            # Step 3 – Leben zurückbekommen
+            element = self.wait.until(EC.presence_of_element_located((By.XPATH, f'//button[contains(text(), "VERBINDLICH BUCHEN")]')))
+            element.click()
 
-        # Step 3 – Leben zurückbekommen
-        element = self.wait.until(EC.presence_of_element_located((By.XPATH, f'//button[contains(text(), "VERBINDLICH BUCHEN")]')))
-        element.click()
+            return self.code_booked
 
-        return self.code_booked
+        self.logger.warning('Could not book appointment via browser - reservation timer keeps expiring')
+        return False
 
 
     def wiggle_recover(self) -> None:
@@ -450,13 +523,19 @@ class Browser:
             sleep(2)
 
 
+    def control_main(self) -> None:
+        """ Kontrollfunktion – führt den Workflow als Zustandsautomat aus; jede Kontrollfunktion
+        gibt den nächsten Zustand zurück, statt die nächste Funktion rekursiv aufzurufen """
+        state = START
+        while state:
+            if self.error_counter >= 5:
+                self.logger.error('Maximum errors and retries exceeded - skipping location for now')
+                return
+            state = getattr(self, f'control_{state}')()
+
     @control_errors
-    def control_main(self):
+    def control_start(self) -> Union[str, None]:
         """ 1/2 Kontrollfunktion um Vermittlungscode zu beziehen """
-        if self.error_counter == 5:
-            self.logger.error('Maximum errors and retries exceeded - skipping location for now')
-            return
-
         # Quick Restart
         if self.error_counter == 0: self.main_page()
         else: self.driver.refresh()
@@ -464,11 +543,16 @@ class Browser:
         self.logger.info(f'Connected to server [{self.server_id}]')
         self.waiting_room()
         self.location_page()
-        if self.code: return self.control_vermittlungscode()
-        if not self.has_vacancy: self.logger.info('No vacancy right now...'); return
+        if self.code: return VERMITTLUNGSCODE
+        if not self.has_vacancy: return self.no_vacancy()
         self.confirm_eligible()
-        if not self.has_vacancy: self.logger.info('No vacancy right now...'); return
-        return self.control_sms()
+        if not self.has_vacancy: return self.no_vacancy()
+        self.record(events.VACANCY)
+        return SMS
+
+    def no_vacancy(self) -> None:
+        self.logger.info('No vacancy right now...')
+        self.record(events.NO_VACANCY)
 
     @control_errors
     def control_sms(self) -> None:
@@ -481,10 +565,13 @@ class Browser:
             return
         sms_code = self.alert_sms()
         self.enter_sms(sms_code)
-        self.logger.info('Add the code you got via mail to settings.py and restart the script!')
+        if settings.LOCATIONS_RELOAD:
+            self.logger.info(f'Add the code you got via mail to {LOCATIONS_PATH} - it is picked up without restarting')
+        else:
+            self.logger.info('Add the code you got via mail to settings.py and restart the script!')
 
     @control_errors
-    def control_vermittlungscode(self):
+    def control_vermittlungscode(self) -> Union[str, None]:
         """ 1/2 Kontrollfunktion gibt Vermittlungscode ein - um Verfügbarkeit
         von Impfterminen mit vorhandenem Vermittlungscode zu prüfen """
         self.fill_code()
@@ -494,9 +581,10 @@ class Browser:
             self.logger.info(
                 f'Ran into what is probably a temporary error with code {self.code}; retrying in '
                 f'{settings.WAIT_SHADOW_BAN // 60}min')
-            sleep(settings.WAIT_SHADOW_BAN)
+            feedback(self.server_id, True)
+            pace(settings.WAIT_SHADOW_BAN)
             self.error_counter += 3
-            return self.control_main()
+            return START
 
         code_reason = ''
         if not self.code_valid: code_reason = f'invalid for server [{self.server_id}]'
@@ -505,62 +593,128 @@ class Browser:
 
         if code_reason:
             self.logger.warning(f'Vermittlungscode "{self.code}" {code_reason}!')
+            self.record(events.CODE_INVALID)
+            state.invalidate(self.location[:5], self.code, code_reason)
             self.logger.info('Removing code from global config for current runtime and continuing without it')
             self.code = ''
-            return self.control_main
+            return START
+
+        return HYBRID if settings.HYBRID_ENABLED else APPOINTMENT
 
-        self.control_appointment()
+    @control_errors
+    def control_hybrid(self) -> Union[str, None]:
+        """ 2/2 Kontrollfunktion (Hybrid) – Browser hat Warteraum und Vermittlungscode passiert;
+        Verfügbarkeit von Impfterminen wird ab hier via REST API mit den Cookies des Browsers geprüft """
+        api = API(driver=self)
+        if settings.ASYNC_ENABLED:
+            # Polling is continued browserless by the asyncio engine (impf/aio.py)
+            self.api = api
+            return
+
+        zip_codes = self.zip_codes or [self.location[:5]]
+        self.logger.info(f'HYBRID_ENABLED - polling appointments for {", ".join(zip_codes)} via REST API '
+                         f'every {settings.WAIT_HYBRID_POLLING}s')
+
+        failures = 0
+        while True:
+            for zip_code in zip_codes:
+                api.zip_code = zip_code
+                appointments = api.control_appointments()
+                if not appointments:
+                    # Expired sessions are already refreshed by the browser (next_gen) – this is a timeout or error
+                    failures += 1
+                    if failures >= HYBRID_FAILURES: raise WorkflowRestart(f'REST API failed {failures} times in a row')
+                    self.logger.warning(f'REST API did not return appointments - retrying in '
+                                        f'{settings.WAIT_HYBRID_POLLING * 2 ** failures}s')
+                    break
+                failures = 0
+
+                termine = appointments.get('termine')
+                changes = tracker.diff(zip_code, termine)
+                if termine and not changes and settings.ALERT_CHANGES_ONLY:
+                    self.logger.info(f'{len(termine)} appointments for {zip_code} unchanged since the last alert')
+                elif termine:
+                    seen = time()
+                    self.logger.warning(f'REST API returned {len(termine)} appointments for {zip_code}!')
+                    if zip_code != self.location[:5]: self.switch_center(api)
+                    self.search_appointments()
+                    self.alert_appointment(api, seen, changes.summary())
+                    tracker.store(zip_code, termine)
+                    sleep(600)
+                    exit()
+                tracker.store(zip_code, termine)
+
+            if failures:
+                sleep(settings.WAIT_HYBRID_POLLING * 2 ** failures)
+                continue
+            if not settings.RESCAN_APPOINTMENT: break
+            pace(settings.WAIT_HYBRID_POLLING)
+
+        self.logger.info('No appointments available right now :(')
+
+    def switch_center(self, api: API) -> None:
+        """ Navigiert zur Terminsuche eines anderen Zentrums auf demselben Server """
+        center = API.zip_center(api.zip_code) or {}
+        self.location_full = f'{api.zip_code} {center.get("Ort", "")}, {center.get("Zentrumsname", "").strip()}'
+        self.driver.get(f'{api.host}/impftermine/suche/{self.code}/{api.zip_code}')
+        self.waiting_room()
 
     @control_errors
-    def control_appointment(self) -> None:
+    def control_appointment(self) -> Union[str, None]:
         """ 2/2 Kontrollfunktion sucht nach Terminen - um Verfügbarkeit von
         Impfterminen mit vorhandenem Vermittlungscode zu prüfen """
+        if not self.search_appointments():
+            self.record(events.NO_APPOINTMENTS)
+        else:
+            seen, api, termine, changes = time(), None, None, None
+            if settings.ALERT_CHANGES_ONLY:
+                # Which slots are new is only known to the REST API (which records the check itself)
+                api = API(driver=self)
+                termine = (api.control_appointments() or {}).get('termine')
+                if termine: changes = tracker.diff(self.location[:5], termine)
+
+            if changes is not None and not changes:
+                self.logger.info(f'{len(termine)} appointments unchanged since the last alert')
+                tracker.store(self.location[:5], termine)
+            else:
+                if not termine: self.record(events.APPOINTMENTS)
+                self.alert_appointment(api, seen, changes.summary() if changes else '')
+                if termine: tracker.store(self.location[:5], termine)
+                sleep(600)
+                exit()
+
+        if not settings.RESCAN_APPOINTMENT:
+            self.logger.info('No appointments available right now :(')
+            return
 
-        appointments = self.search_appointments()
-        if settings.RESCAN_APPOINTMENT and not appointments:
+        if not settings.RATE_LIMIT_ENABLED:
             self.logger.info(f'RESCAN_APPOINTMENT is enabled - automatically rechecking in '
                              f'{settings.WAIT_RESCAN_APPOINTMENTS // 60}min...')
-            while not appointments:
-                sleep(settings.WAIT_RESCAN_APPOINTMENTS)
-                self.logger.info('Rechecking for new appointments')
-                appointments = self.search_appointments()
-
-        if appointments:
-            self.alert_appointment()
-            sleep(600)
-            exit()
-        if settings.RESCAN_APPOINTMENT: return self.control_appointment()
-        # Rescanning for appointments not enabled
-        self.logger.info('No appointments available right now :(')
+        pace(settings.WAIT_RESCAN_APPOINTMENTS)
+        self.logger.info('Rechecking for new appointments')
+        return APPOINTMENT
 
-
-    def control_assert(self):
+    def control_assert(self) -> Union[str, None]:
         """ Hilfsfunktion - wenn ein AssertionError auftritt (Titel stimmt nicht mit aktuellem
         Funktionsabruf überein) fährt der Bot mit dem entsprechenden Workflow für wesentliche
         Schlüsselseiten (Terminbuchung, SMS Bestätigung, ...) fort.
         Das ermöglicht es dem User außerdem frei auf der Seite zu navigieren, ohne den Bot
         zum Absturz zu führen und autom. an der aktuellen Stelle fortzufahren """
         title = self.driver.find_element_by_xpath('//h1')
-        self.logger.info(f'Current page title is "{title}"')
+        self.logger.info(f'Current page title is "{title.text}"')
 
-        if title.text == 'Wurde Ihr Anspruch auf eine Corona-Schutzimpfung bereits geprüft?' and self.code:
-            self.logger.info('Continuing with <control_vermuttlingscode>')
+        state = TITLES.get(title.text)
+        if state == VERMITTLUNGSCODE and self.code:
+            self.logger.info('Continuing with <control_vermittlungscode>')
             self.location_page()
-            return self.control_vermittlungscode()
-
-        if title.text == 'Vermittlungscode anfordern':
-            self.logger.info('Continuing with <control_sms>')
-            return self.control_sms()
-
-        if title.text == 'Onlinebuchung für Ihre Corona-Schutzimpfung':
-            self.logger.info('Continuing with <control_appointment>')
-            return self.control_appointment()
+            return state
 
-        if title.text == 'Buchen Sie die Termine für Ihre Corona-Schutzimpfung':
-            self.error_counter = 0
+        if state in (SMS, APPOINTMENT):
+            self.logger.info(f'Continuing with <control_{state}>')
+            return state
 
         # Virtueller Warteraum des Impfterminservice
         # SMS Verifizierung
-        self.logger.info('Continuing with reset via <control_main>')
-        self.error_counter = 1
-        return self.control_main()
+        self.logger.info('Continuing with reset via <control_start>')
+        self.error_counter = 0 if title.text == MAIN_TITLE else 1
+        return START
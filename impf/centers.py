@@ -0,0 +1,118 @@
+""" Catalog of all vaccination centers – `impfzentren.json` is cached on disk, revalidated
+using ETag / Last-Modified and indexed by ZIP code, server id and Bundesland """
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from threading import Lock
+from time import time
+from typing import Dict, List, Union
+
+import requests
+
+import settings
+from impf import transport
+from impf.constructors import server_id, service_url
+
+logger = logging.getLogger(__name__)
+
+CENTERS_PATH = '/assets/static/impfzentren.json'
+
+
+@dataclass
+class CenterCatalog:
+    path: str
+    ttl: int  # Seconds before the cached file is revalidated with the server
+    by_zip: Dict[str, dict] = field(init=False, default_factory=dict)
+    by_server: Dict[str, List[dict]] = field(init=False, default_factory=dict)
+    by_state: Dict[str, List[dict]] = field(init=False, default_factory=dict)
+    _etag: str = field(init=False, default='')
+    _last_modified: str = field(init=False, default='')
+    _checked: float = field(init=False, default=0)
+    _lock: Lock = field(init=False, default_factory=Lock)
+
+    def _index(self, centers: Dict[str, List[dict]]) -> None:
+        by_zip, by_server, by_state = {}, {}, {}
+        for state, _centers in centers.items():
+            for center in _centers:
+                center.setdefault('Bundesland', state)
+                by_zip.setdefault(center.get('PLZ'), center)
+                by_server.setdefault(server_id(center.get('URL', '')), []).append(center)
+                by_state.setdefault(state, []).append(center)
+        self.by_zip, self.by_server, self.by_state = by_zip, by_server, by_state
+
+    def _load(self) -> None:
+        """ Loads the cached catalog from disk """
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f'Could not read center catalog {self.path} - ignoring it')
+            return
+        self._etag, self._last_modified = cache.get('etag', ''), cache.get('last_modified', '')
+        self._checked = cache.get('checked', 0)
+        self._index(cache.get('centers', {}))
+
+    def _save(self, centers: Dict[str, List[dict]]) -> None:
+        cache = {
+            'etag': self._etag,
+            'last_modified': self._last_modified,
+            'checked': self._checked,
+            'centers': centers
+        }
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+        except OSError:
+            logger.exception(f'Could not persist center catalog {self.path}')
+
+    def refresh(self, force: bool = False) -> None:
+        """ Revalidates the catalog if it is older than `ttl`; keeps using
+        the cached catalog if the static endpoint is slow or unavailable """
+        with self._lock:
+            if not self._checked: self._load()
+            if not force and self.by_zip and time() - self._checked < self.ttl: return
+
+            from impf.api import HEADERS
+            headers = dict(HEADERS)
+            if self.by_zip and self._etag: headers['If-None-Match'] = self._etag
+            if self.by_zip and self._last_modified: headers['If-Modified-Since'] = self._last_modified
+            try:
+                r = transport.shared().get(f'{service_url()}{CENTERS_PATH}', headers=headers, timeout=10)
+            except requests.RequestException as e:
+                logger.warning(f'Could not revalidate center catalog ({e}) - using cached catalog')
+                self._checked = time() - self.ttl + 60  # retry in a minute
+                return
+
+            self._checked = time()
+            if r.status_code == 304:
+                logger.debug('Center catalog not modified')
+            elif r.status_code == 200 and r.json():
+                self._etag, self._last_modified = r.headers.get('ETag', ''), r.headers.get('Last-Modified', '')
+                self._index(r.json())
+                logger.info(f'Loaded {len(self.by_zip)} centers on {len(self.by_server)} servers')
+            else:
+                logger.warning(f'Center catalog returned [{r.status_code}] - using cached catalog')
+                return
+            self._save({state: centers for state, centers in self.by_state.items()})
+
+    def zip(self, zip_code: str) -> Union[dict, None]:
+        self.refresh()
+        return self.by_zip.get(zip_code)
+
+    def server(self, server: str) -> List[dict]:
+        self.refresh()
+        return self.by_server.get(server, [])
+
+    def state(self, state: str) -> List[dict]:
+        self.refresh()
+        return self.by_state.get(state, [])
+
+    def server_id(self, zip_code: str) -> str:
+        """ Returns the server id a center is hosted on; empty if unknown """
+        center = self.zip(zip_code)
+        return server_id(center.get('URL', '')) if center else ''
+
+
+catalog = CenterCatalog(path=os.path.join(settings.WORK_DIR, 'impfzentren.json'), ttl=settings.CENTERS_TTL)
@@ -4,7 +4,9 @@ import logging
 import locale
 from datetime import datetime
 from typing import List
+from urllib.parse import urlparse
 
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.options import Options
 import settings
 
@@ -21,13 +23,39 @@ except ModuleNotFoundError:
     if settings.ZULIP_ENABLED: logger.warning('Zulip package not found, but ZULIP_ENABLED configured '
                                               '- cannot send alerts via zulip until package is installed')
 
+# Resolves once an element matching the XPath is (not) present – checked on every DOM mutation
+# instead of polling, so waits end the moment the page reaches the expected state
+OBSERVE_SCRIPT = '''
+const [xpath, present, timeout, done] = arguments;
+const matches = () => (document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null)
+    .singleNodeValue !== null) === present;
+if (matches()) return done(true);
+const observer = new MutationObserver(() => {
+    if (!matches()) return;
+    observer.disconnect();
+    clearTimeout(timer);
+    done(true);
+});
+const timer = setTimeout(() => { observer.disconnect(); done(false); }, timeout);
+observer.observe(document, {childList: true, subtree: true, characterData: true, attributes: true});
+'''
+
+
 def browser_options():
     """ Helper function to build Selenium Browser options """
     opts = Options()
     opts.add_experimental_option("excludeSwitches", ["enable-automation"])
     opts.add_experimental_option("excludeSwitches", ["enable-logging"])
     if settings.SELENIUM_DEBUG: opts.add_argument('--auto-open-devtools-for-tabs')
+    # DevTools network events for detecting `429`
+    opts.set_capability('goog:loggingPrefs', {'performance': 'ALL', 'browser': 'ALL'})
     if settings.USER_AGENT != 'default': opts.add_argument(f'user-agent={settings.USER_AGENT}')
+    if settings.HEADLESS:
+        opts.add_argument('--headless')
+        opts.add_argument('--disable-gpu')
+        opts.add_argument('--window-size=1280,1024')  # default of 800x600 hides buttons behind the cookie banner
+        # Nobody looks at the page – don't decode and render images at all
+        opts.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
     # Fallback, falls Chrome Installation in Program Files installiert ist
     if settings.CHROME_PATH: opts.binary_location = settings.CHROME_PATH
     if not settings.CONCURRENT_ENABLED:
@@ -39,6 +67,34 @@ def browser_options():
     return opts
 
 
+def devtools_setup(driver) -> None:
+    """ Applies DevTools settings to a freshly started headless browser – blocks BLOCK_URLS and
+    hides `HeadlessChrome` from the user agent, which is a giveaway for bot protection """
+    if not settings.HEADLESS: return  # Keep the page intact for users taking over the browser
+    try:
+        if settings.BLOCK_URLS:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': settings.BLOCK_URLS})
+        if settings.USER_AGENT == 'default':
+            user_agent = driver.execute_script('return navigator.userAgent')
+            driver.execute_cdp_cmd('Network.setUserAgentOverride', {
+                'userAgent': user_agent.replace('HeadlessChrome', 'Chrome')
+            })
+    except WebDriverException:
+        logger.exception('Could not apply DevTools settings – is your chromedriver outdated?')
+
+
+def service_url(server: str = '') -> str:
+    """ Base URL of the ImpfterminService (SERVICE_URL) or of one of its servers (001, 002, ...) """
+    url = settings.SERVICE_URL.rstrip('/')
+    return url.replace('://www.', f'://{server}-iz.', 1) if server else url
+
+
+def server_id(url: str) -> str:
+    """ Returns the server identifier of an ImpfterminService URL (001, 002, ...) """
+    return (urlparse(url).hostname or '')[:3]
+
+
 def _format_appointments(appointment: list) -> str:
     """ Helper function for formatting an appointment """
     s = []
@@ -92,13 +148,24 @@ def zulip_read_payload() -> dict:
     return request
 
 
+def zulip_narrow() -> list:
+    """ Narrow of zulip_read_payload in the format expected by the event queue API """
+    return [[n.get('operator'), n.get('operand')] for n in zulip_read_payload().get('narrow')]
+
+
+_zulip_client = None
+
+
 def zulip_client():
+    """ Returns the cached Zulip Client – instantiated once and reused for all messages """
+    global _zulip_client
+    if _zulip_client is not None: return _zulip_client
     try:
-        return zulip.Client(
+        _zulip_client = zulip.Client(
             email=settings.ZULIP_MAIL,
             site=settings.ZULIP_URL,
             api_key=settings.ZULIP_KEY
         )
     except:
         logger.exception('An error occurred trying to instantiate Zulip Client')
-        return None
\ No newline at end of file
+    return _zulip_client
\ No newline at end of file
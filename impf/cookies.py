@@ -0,0 +1,90 @@
+""" Akamai cookie store shared by all workers – keyed by server id and persisted
+to disk, so API sessions survive restarts and don't need a browser for every refresh """
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from threading import Lock
+from time import time
+from typing import Dict, List, Tuple
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+AKAMAI_COOKIES = ['bm_sz', 'ak_bmsc', '_abck', 'bm_sv', 'akavpau_User_allowed']
+
+
+@dataclass
+class CookieJar:
+    path: str
+    ttl: int  # Maximum lifetime of cookies in seconds, if the server didn't send a shorter one
+    _servers: Dict[str, dict] = field(init=False, default_factory=dict)
+    _locks: Dict[str, Lock] = field(init=False, default_factory=dict)
+    _lock: Lock = field(init=False, default_factory=Lock)
+    _mtime: float = field(init=False, default=0)
+
+    def _load(self) -> None:
+        """ (Re)loads the jar if another process updated the file """
+        if not self.path or not os.path.exists(self.path): return
+        mtime = os.path.getmtime(self.path)
+        if mtime <= self._mtime: return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                servers = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f'Could not read cookie store {self.path} - ignoring it')
+            return
+        for server, entry in servers.items():
+            if entry.get('generation', 0) >= self._servers.get(server, {}).get('generation', 0):
+                self._servers[server] = entry
+        self._mtime = mtime
+
+    def _save(self) -> None:
+        if not self.path: return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._servers, f)
+        os.replace(tmp, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def lock(self, server: str) -> Lock:
+        """ Lock to ensure only one refresh per server runs at a time """
+        with self._lock:
+            return self._locks.setdefault(server, Lock())
+
+    def get(self, server: str) -> Tuple[Dict[str, str], int]:
+        """ Returns still valid cookies for server along with their generation """
+        with self._lock:
+            self._load()
+            entry = self._servers.get(server, {})
+        if entry.get('expires', 0) <= time(): return {}, entry.get('generation', 0)
+        return entry.get('cookies', {}), entry.get('generation', 0)
+
+    def store(self, server: str, cookies: List[dict]) -> int:
+        """ Stores Selenium-style cookies (`name`, `value`, optional `expiry`)
+        and returns the new generation """
+        expires = time() + self.ttl
+        for cookie in cookies:
+            if cookie.get('name') in AKAMAI_COOKIES and cookie.get('expiry'):
+                expires = min(expires, cookie.get('expiry'))
+
+        with self._lock:
+            self._load()
+            generation = self._servers.get(server, {}).get('generation', 0) + 1
+            self._servers[server] = {
+                'cookies': {c['name']: c['value'] for c in cookies},
+                'expires': expires,
+                'generation': generation
+            }
+            try:
+                self._save()
+            except OSError:
+                logger.exception(f'Could not persist cookie store {self.path}')
+        return generation
+
+
+jar = CookieJar(
+    path=os.path.join(settings.WORK_DIR, 'cookies.json') if settings.COOKIE_STORE_ENABLED else '',
+    ttl=settings.COOKIE_TTL
+)
@@ -0,0 +1,221 @@
+""" Coordinator / worker mode – the coordinator owns LOCATIONS, their server grouping and which
+worker is banned on which server. Workers on other hosts (i.e. other egress IPs, as `429`s apply
+per IP) lease a location via HTTP, heartbeat while checking it and report the outcome. Leases of
+workers which stop heartbeating expire and the location is handed to the next worker """
+import json
+import logging
+import socket
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from time import sleep, time
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import requests
+
+import settings
+from impf import events, transport
+
+logger = logging.getLogger(__name__)
+
+WAIT_IDLE = 30  # Seconds a worker waits before asking again if no location is available
+
+
+@dataclass
+class Lease:
+    id: str
+    worker: str
+    idx: int  # Index of the location
+    expires: float
+
+
+@dataclass
+class Coordinator:
+    locations: List[Dict]
+    ttl: int  # Seconds a lease is valid without heartbeat
+    _leases: Dict[str, Lease] = field(init=False, default_factory=dict)
+    _servers: Dict[int, str] = field(init=False, default_factory=dict)  # Server id by location, as reported
+    _checked: Dict[int, float] = field(init=False, default_factory=dict)
+    _bans: Dict[Tuple[str, str], float] = field(init=False, default_factory=dict)  # (worker, server): until
+    _lock: Lock = field(init=False, default_factory=Lock)
+
+    def _expire(self) -> None:
+        for lease in [l for l in self._leases.values() if l.expires < time()]:
+            logger.warning(f'Lease of {self.locations[lease.idx]["location"]} by {lease.worker} expired - re-assigning')
+            del self._leases[lease.id]
+
+    def banned(self, worker: str, server: str) -> bool:
+        return self._bans.get((worker, server), 0) > time()
+
+    def lease(self, worker: str) -> Optional[Lease]:
+        """ Leases the least recently checked location which isn't leased and whose
+        server the worker isn't banned on """
+        with self._lock:
+            self._expire()
+            leased = {lease.idx for lease in self._leases.values()}
+            free = [idx for idx in range(len(self.locations))
+                    if idx not in leased and not self.banned(worker, self._servers.get(idx, ''))]
+            if not free: return None
+            idx = min(free, key=lambda i: self._checked.get(i, 0))
+            lease = Lease(id=uuid4().hex, worker=worker, idx=idx, expires=time() + self.ttl)
+            self._leases[lease.id] = lease
+        logger.info(f'Leased {self.locations[idx]["location"]} to {worker}')
+        return lease
+
+    def heartbeat(self, lease_id: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease: lease.expires = time() + self.ttl
+            return bool(lease)
+
+    def report(self, lease_id: str, location: Dict, server: str = '', outcome: str = '') -> bool:
+        """ Releases a lease, taking over the location's code (unset if it turned out
+        invalid) and banning the worker on the server if it got a `429` """
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+            if not lease: return False
+            _location = self.locations[lease.idx]
+            if location.get('code') != _location.get('code'):
+                logger.info(f'{lease.worker}: code of {_location["location"]} changed to "{location.get("code")}"')
+                _location['code'] = location.get('code', '')
+            self._checked[lease.idx] = time()
+            if server: self._servers[lease.idx] = server
+            if outcome == events.TOO_MANY_REQUESTS:
+                logger.warning(f'{lease.worker} got `429` from server [{server}] - '
+                               f'not leasing its locations to it for {settings.WAIT_SHADOW_BAN}s')
+                self._bans[(lease.worker, server)] = time() + settings.WAIT_SHADOW_BAN
+        return True
+
+    def status(self) -> Dict:
+        with self._lock:
+            self._expire()
+            return {
+                'leases': [{'worker': l.worker, 'location': self.locations[l.idx]['location'],
+                            'expires': int(l.expires - time())} for l in self._leases.values()],
+                'bans': [{'worker': w, 'server': s, 'until': int(u)} for (w, s), u in self._bans.items() if u > time()],
+            }
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    coordinator: Coordinator = None
+
+    def _reply(self, status: int, data: Dict = None) -> None:
+        body = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        if not settings.COORDINATOR_TOKEN: return True
+        if self.headers.get('Authorization') == f'Bearer {settings.COORDINATOR_TOKEN}': return True
+        self._reply(401)
+        return False
+
+    def do_GET(self) -> None:
+        if not self._authorized(): return
+        if self.path != '/status': return self._reply(404)
+        self._reply(200, self.coordinator.status())
+
+    def do_POST(self) -> None:
+        if not self._authorized(): return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or '{}')
+        except ValueError:
+            return self._reply(400)
+
+        if self.path == '/lease':
+            lease = self.coordinator.lease(data.get('worker', self.client_address[0]))
+            if not lease: return self._reply(204)
+            return self._reply(200, {'lease': lease.id, 'location': self.coordinator.locations[lease.idx],
+                                     'ttl': self.coordinator.ttl})
+        if self.path == '/heartbeat':
+            return self._reply(200 if self.coordinator.heartbeat(data.get('lease', '')) else 404)
+        if self.path == '/report':
+            reported = self.coordinator.report(data.get('lease', ''), data.get('location', {}),
+                                               data.get('server', ''), data.get('outcome', ''))
+            return self._reply(200 if reported else 404)
+        self._reply(404)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def serve(locations: List[Dict], port: int) -> None:
+    """ Runs the coordinator until stopped """
+    CoordinatorHandler.coordinator = Coordinator(locations=locations, ttl=settings.COORDINATOR_LEASE)
+    server = ThreadingHTTPServer(('0.0.0.0', port), CoordinatorHandler)
+    logger.info(f'Coordinating {len(locations)} locations on port {port}')
+    if not settings.COORDINATOR_TOKEN: logger.warning('COORDINATOR_TOKEN not set - anyone reaching this port can lease your codes')
+    server.serve_forever()
+
+
+@dataclass
+class Worker:
+    url: str
+    name: str = field(default_factory=socket.gethostname)
+    session: requests.Session = field(init=False, default_factory=transport.session)
+
+    def __post_init__(self) -> None:
+        self.url = self.url.rstrip('/')
+        if settings.COORDINATOR_TOKEN: self.session.headers['Authorization'] = f'Bearer {settings.COORDINATOR_TOKEN}'
+
+    def _post(self, path: str, **data) -> requests.Response:
+        return self.session.post(f'{self.url}{path}', json=data, timeout=settings.ALERT_TIMEOUT)
+
+    def lease(self) -> Optional[Dict]:
+        r = self._post('/lease', worker=self.name)
+        r.raise_for_status()
+        return r.json() if r.status_code == 200 else None
+
+    def heartbeat(self, lease: Dict, done: Event) -> None:
+        """ Keeps the lease alive until `done` is set """
+        while not done.wait(lease.get('ttl') / 3):
+            try:
+                if self._post('/heartbeat', lease=lease.get('lease')).status_code == 404:
+                    logger.warning(f'Lease of {lease["location"]["location"]} was lost to another worker')
+            except requests.RequestException:
+                logger.warning('Could not reach coordinator for heartbeat')
+
+    def report(self, lease: Dict, result: Dict) -> None:
+        """ Reports the location (with its code) and the server and outcome of the check """
+        location = {k: v for k, v in result.items() if k not in ('server', 'outcome')}
+        self._post('/report', lease=lease.get('lease'), location=location,
+                   server=result.get('server', ''), outcome=result.get('outcome', ''))
+
+    def work(self, check: Callable[[Dict], Dict]) -> None:
+        """ Leases locations and checks them with `check` until stopped – `check` returns
+        the location along with `server` and `outcome` of the check """
+        while True:
+            try:
+                lease = self.lease()
+            except (requests.RequestException, ValueError):
+                logger.exception(f'Could not lease location from coordinator {self.url}')
+                lease = None
+            if not lease:
+                sleep(WAIT_IDLE)
+                continue
+
+            done = Event()
+            Thread(target=self.heartbeat, args=(lease, done), daemon=True).start()
+            location = lease.get('location')
+            try:
+                location = check(location)
+            except Exception:
+                logger.exception(f'Unexpected exception occurred checking {location.get("location")}')
+            finally:
+                done.set()
+                try:
+                    self.report(lease, location)
+                except requests.RequestException:
+                    logger.warning(f'Could not report {location.get("location")} to coordinator')
+
+    def run(self, check: Callable[[Dict], Dict], workers: int = 1) -> None:
+        logger.info(f'Working for coordinator {self.url} as {self.name} with {workers} workers')
+        threads = [Thread(target=self.work, args=(check,), name=f'worker-{i}') for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
@@ -1,24 +1,37 @@
 from datetime import datetime, timedelta
-from time import sleep
+from functools import wraps
+from time import sleep, time
+from typing import List
 import logging
 
 from requests import Timeout, ConnectionError
 from selenium.common.exceptions import StaleElementReferenceException, WebDriverException
 
 import settings
-from impf.exceptions import AdvancedSessionCache, AlertError
+from impf import events, metrics
+from impf.constructors import server_id
+from impf.exceptions import AdvancedSessionCache, AlertError, WorkflowRestart
+from impf.breaker import breaker
+from impf.limiter import throttle, feedback, limiter
 
 logger = logging.getLogger(__name__)
 
 
+def sleep_hours() -> List[int]:
+    """ Hours to pause the bot in – 2300-0600 or the inactive hours of the polling profile """
+    if settings.POLLING_PROFILE:
+        active = events.active_hours()
+        if active: return [hour for hour in range(24) if hour not in active]
+    return [23, 0, 1, 2, 3, 4, 5]
+
+
 def sleep_bot() -> bool:
     """ Helper function to sleep bot during night"""
-    now = datetime.now()
-    if settings.SLEEP_NIGHT and (now.hour >= 23 or now.hour < 6):
-        logger.info('SLEEP_NIGHT enabled and current time is between 2300-0600; pausing bot')
-        while now.hour >= 23 or now.hour < 6:
+    hours = sleep_hours()
+    if settings.SLEEP_NIGHT and datetime.now().hour in hours:
+        logger.info(f'SLEEP_NIGHT enabled and no slots expected at {datetime.now().hour}:00; pausing bot')
+        while datetime.now().hour in hours:
             sleep(120)
-            now = datetime.now()
         logger.info('Resuming Impf Bot.py!')
         return True
     return False
@@ -30,46 +43,80 @@ def shadow_ban(f):
     def func(self, *args, **kwargs):
         if sleep_bot():
             self.error_counter = 0
-            return self.control_main()
+            raise WorkflowRestart('Resuming after SLEEP_NIGHT')
 
+        server = self.server_id
+        throttle(server)
+        started = time()
         x = f(self, *args, **kwargs)
 
-        shadow_ban = self.too_many_requests  # oh Python 3.8...
+        shadow_ban = self.rate_limited(started)  # oh Python 3.8...
+        feedback(server, shadow_ban)
         if shadow_ban:
+            self.record(events.TOO_MANY_REQUESTS)
             self.logger.warning('Sending too many requests - got `429` from server!')
             if not settings.AVOID_SHADOW_BAN: self.logger.info('AVOID_SHADOW_BAN not enabled; continuing without waiting')
             self.error_counter += 1
             while self.error_counter <= 4 and shadow_ban and settings.AVOID_SHADOW_BAN:
-                wait_time = settings.WAIT_SHADOW_BAN + (2 * 60 * self.error_counter)
+                if settings.CIRCUIT_BREAKER_ENABLED:
+                    # The circuit breaker shared by all workers determines how long to wait
+                    wait_time = int(breaker(server).remaining())
+                elif settings.RATE_LIMIT_ENABLED:
+                    # The penalized rate limit determines how long to wait
+                    wait_time = int(limiter(server).delay())
+                else:
+                    wait_time = settings.WAIT_SHADOW_BAN + (2 * 60 * self.error_counter)
                 self.logger.info(f'[{self.error_counter}/5] Attempting to recover from shadow ban by waiting until '
                                  f'{(datetime.now() + timedelta(seconds=wait_time)).strftime("%H:%M:%S")} ({wait_time // 60}min)')
 
                 self.error_counter += 1
-                sleep(wait_time)
+                if settings.CIRCUIT_BREAKER_ENABLED or settings.RATE_LIMIT_ENABLED: throttle(server)
+                else: sleep(wait_time)
+                started = time()
                 x = f(self, *args, **kwargs)
-                shadow_ban = self.too_many_requests
+                shadow_ban = self.rate_limited(started)
+                feedback(server, shadow_ban)
 
             if not shadow_ban: self.error_counter = 0
-            else: return self.control_main()
+            else: raise WorkflowRestart('Could not recover from shadow ban')
 
         return x
     return func
 
 
+def timed(f):
+    """ Decorator to record the duration of a browser step in impf_step_seconds """
+    @wraps(f)
+    def func(self, *args, **kwargs):
+        started = time()
+        try:
+            return f(self, *args, **kwargs)
+        finally:
+            metrics.observe('impf_step_seconds', time() - started,
+                            step=f.__name__, location=self.location[:5], server=self.server_id)
+    return func
+
+
 def control_errors(f):
     """ Decorator to centrally coordinate error handling of control functions"""
     def func(self, *args, **kwargs):
         try:
             return f(self, *args, **kwargs)
-        except StaleElementReferenceException:
+        except WorkflowRestart as e:
+            self.logger.info(f'{e} - restarting workflow')
+            return self.restart()
+        except StaleElementReferenceException as e:
+            metrics.inc('impf_control_errors_total', step=f.__name__, error=type(e).__name__)
             self.logger.warning('StaleElementReferenceException - we probably detatched somehow; reinitializing')
             # Reinitialize the browser, so we can reattach –
             if self.keep_browser:
                 return self.reset()
         except WebDriverException as e:
+            metrics.inc('impf_control_errors_total', step=f.__name__, error=type(e).__name__)
             if 'chrome not reachable' in str(e):
                 return self.reset()
-        except AssertionError:
+        except AssertionError as e:
+            metrics.inc('impf_control_errors_total', step=f.__name__, error=type(e).__name__)
             self.logger.error(f'AssertionError occurred in <{f.__name__}>. This usually happens if your computer/internet '
                               'connection is slow or if the ImpfterminService site changed.')
             self.logger.error('Sleeping for 120s before continuing, giving the user the '
@@ -78,7 +125,8 @@ def control_errors(f):
             return self.control_assert()
         except SystemExit:
             self.logger.warning('Exiting...')
-        except:
+        except BaseException as e:
+            metrics.inc('impf_control_errors_total', step=f.__name__, error=type(e).__name__)
             self.logger.exception(f'An unexpected exception occurred in <{f.__name__}>')
             if settings.KEEP_BROWSER_CRASH:
                 self.logger.exception('KEEP_BROWSER_CRASH configured; keeping browser open post crash')
@@ -92,6 +140,7 @@ def control_errors(f):
 
 def alert_resilience(f):
     """ Decorator to make alerts error-resilient """
+    @wraps(f)
     def func(*args, **kwargs):
         try:
             return f(*args, **kwargs)
@@ -106,19 +155,30 @@ def alert_resilience(f):
 def api_call(f):
     """ Decorator for API calls """
     def api_response(self, *args, **kwargs):
-        try:
-            response = f(self, *args, **kwargs)
-        except Timeout:
-            self.logger.warning(f'Request timed out <{f.__name__}> (*{args}) (**{kwargs})')
-        except ConnectionError:
-            self.logger.warning(f'Request timed out <{f.__name__}> (*{args}) (**{kwargs})')
-        else:
+        server = server_id(args[0] if args else kwargs.get('url', ''))
+        while True:
+            throttle(server)
+            try:
+                response = f(self, *args, **kwargs)
+            except Timeout:
+                self.logger.warning(f'Request timed out <{f.__name__}> (*{args}) (**{kwargs})')
+                return
+            except ConnectionError:
+                self.logger.warning(f'Request timed out <{f.__name__}> (*{args}) (**{kwargs})')
+                return
+
             self.logger.debug(f'<{f.__name__}> [{response.status_code}] {response.text}')
+            feedback(server, response.status_code == 429)
+            if response.status_code == 429:
+                self.last_429 = time()
+                zip_code = (kwargs.get('params') or kwargs.get('json') or {}).get('plz', '')
+                events.record(zip_code, server, events.TOO_MANY_REQUESTS)
             if response.status_code in (200, 201, 481):
+                self.error_counter = 0
                 return response
             x = self._handle_error(response.status_code, response.json())
+            if x: return x
             # Rise and Shine (once again) – danke kv.digital
-            return x or api_call(f)(self, *args, **kwargs)
 
     return api_response
 
@@ -126,15 +186,14 @@ def api_call(f):
 def next_gen(f):
     """ Decorator for NextGen Impfservice-specific error handling """
     def func(self, *args, **kwargs):
+        while True:
+            try:
+                return f(self, *args, **kwargs)
+            except AdvancedSessionCache:
+                self.logger.warning(f'Underlying service layer indicating invalid session for <{f.__name__}> – refreshing '
+                                    f'all cookies and retrying')
+                metrics.inc('impf_session_refreshes_total', server=self.server_id)
+                self.xs.session.cookies.clear()
+                self.refresh_cookies()
 
-        try:
-            x = f(self, *args, **kwargs)
-        except AdvancedSessionCache:
-            self.logger.warning(f'Underlying service layer indicating invalid session for <{f.__name__}> – refreshing '
-                                f'all cookies and retrying')
-            self.xs.session.cookies = {}
-            self.refresh_cookies()
-            return next_gen(f)(self, *args, **kwargs)
-        return x
-
-    return func
\ No newline at end of file
+    return func
@@ -0,0 +1,107 @@
+""" Append-only store of check outcomes (`events.jsonl`) and the offline analyzer building
+a time-of-day polling profile from it – one compact JSON object per line:
+{"t": timestamp, "l": location, "s": server, "o": outcome, "n": number of termine} """
+import json
+import logging
+import os
+from datetime import datetime
+from threading import Lock
+from time import time
+from typing import Dict, Iterator, List
+
+import settings
+from impf.state import state
+
+logger = logging.getLogger(__name__)
+
+NO_VACANCY = 'no_vacancy'
+VACANCY = 'vacancy'
+TOO_MANY_REQUESTS = '429'
+CODE_INVALID = 'code_invalid'
+NO_APPOINTMENTS = 'no_appointments'
+APPOINTMENTS = 'appointments'
+FOUND = (VACANCY, APPOINTMENTS)
+CHECKED = (NO_VACANCY, VACANCY, NO_APPOINTMENTS, APPOINTMENTS)
+
+EVENTS_PATH = os.path.join(settings.WORK_DIR, 'events.jsonl')
+PROFILE_PATH = os.path.join(settings.WORK_DIR, 'polling_profile.json')
+MIN_CHECKS = 10  # Checks per hour required before an hour without slots is considered inactive
+
+_lock = Lock()
+
+
+def record(location: str, server: str, outcome: str, termine: int = None) -> None:
+    """ Appends a check outcome to the event store if EVENTS_ENABLED """
+    state.checked(location, server, outcome)
+    if not settings.EVENTS_ENABLED: return
+    event = {'t': int(time()), 'l': location, 's': server, 'o': outcome}
+    if termine is not None: event['n'] = termine
+    try:
+        with _lock, open(EVENTS_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event, separators=(',', ':')) + '\n')
+    except OSError:
+        logger.exception(f'Could not write event to {EVENTS_PATH}')
+
+
+def read(path: str = EVENTS_PATH) -> Iterator[Dict]:
+    if not os.path.exists(path): return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # partially written line
+
+
+def histograms(events: Iterator[Dict]) -> Dict[str, Dict[str, List[int]]]:
+    """ Per center and hour of day: number of checks and number of times slots
+    appeared, i.e. a check found vacancy / appointments after one that didn't """
+    centers = {}
+    found_before = {}
+    for event in events:
+        if event.get('o') not in CHECKED: continue
+        location, hour = event.get('l'), datetime.fromtimestamp(event.get('t')).hour
+        center = centers.setdefault(location, {'checks': [0] * 24, 'appeared': [0] * 24})
+        center['checks'][hour] += 1
+        found = event.get('o') in FOUND
+        if found and not found_before.get(location): center['appeared'][hour] += 1
+        found_before[location] = found
+    return centers
+
+
+def profile(centers: Dict[str, Dict[str, List[int]]]) -> Dict:
+    """ Hours in which slots appeared or which weren't checked often enough to tell """
+    checks = [sum(c['checks'][hour] for c in centers.values()) for hour in range(24)]
+    appeared = [sum(c['appeared'][hour] for c in centers.values()) for hour in range(24)]
+    active = [hour for hour in range(24) if appeared[hour] or checks[hour] < MIN_CHECKS]
+    return {'active': active, 'checks': checks, 'appeared': appeared}
+
+
+def analyze(path: str = EVENTS_PATH) -> None:
+    """ Prints per center histograms of when slots appear and writes the polling profile """
+    centers = histograms(read(path))
+    if not centers:
+        print(f'No events recorded in {path} yet – run the bot with EVENTS_ENABLED first')
+        return
+
+    print(f'Hour  {"".join(f"{h:>4}" for h in range(24))}')
+    for location, center in sorted(centers.items()):
+        print(f'{location:<5} {"".join(f"{n:>4}" for n in center["appeared"])}  '
+              f'(slots appeared; {sum(center["checks"])} checks)')
+
+    _profile = profile(centers)
+    with open(PROFILE_PATH, 'w', encoding='utf-8') as f:
+        json.dump(_profile, f)
+    print(f'\nActive hours: {", ".join(str(h) for h in _profile["active"])}')
+    print(f'Polling profile written to {PROFILE_PATH} – set POLLING_PROFILE = True to use it')
+
+
+def active_hours() -> List[int]:
+    """ Hours of the polling profile the bot should run in; empty if there is no profile """
+    if not os.path.exists(PROFILE_PATH): return []
+    try:
+        with open(PROFILE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f).get('active', [])
+    except (OSError, ValueError):
+        logger.warning(f'Could not read polling profile {PROFILE_PATH} - ignoring it')
+        return []
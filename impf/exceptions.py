@@ -35,3 +35,15 @@ class AlertError(Exception):
 
     def __str__(self):
         return f'[{self.code}] {self.message}'
+
+
+class WorkflowRestart(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+    def __repr__(self):
+        return f'WorkflowRestart({self.message!r})'
+
+    def __str__(self):
+        return f'{self.message}'
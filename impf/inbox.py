@@ -0,0 +1,122 @@
+""" Inbound replies (`sms:` / `appt:`) from Zulip and Telegram – one reader thread per backend
+keeps the read cursor and hands each reply to exactly one waiting worker, so the amount of
+inbound requests stays the same no matter how many workers are waiting """
+import logging
+import re
+from dataclasses import dataclass, field
+from threading import Condition, Event, Thread
+from time import sleep, time
+from typing import Callable, Dict, List, Tuple
+
+import settings
+from impf.alert import zulip_read, telegram_read
+
+logger = logging.getLogger(__name__)
+
+# sms:123-456 or sms:71636:123-456 to address the location with ZIP code 71636
+SMS_RE = re.compile(r"sms:(?:(\d{5}):)?(\d{3})-?(\d{3})")
+# appt:1 or appt:71636:1
+APPT_RE = re.compile(r"appt:(?:(\d{5}):)?(\d+)")
+UNCLAIMED_TTL = 120  # Seconds a reply no one waited for can still be claimed
+
+
+def parse_reply(string: str) -> Tuple[str, str, str]:
+    """ Returns case (`sms`, `appt`), ZIP code (may be empty) and code of a reply """
+    if not string: return '', '', ''
+    m = SMS_RE.search(string.strip())
+    if m: return 'sms', m.group(1) or '', m.group(2) + m.group(3)
+    m = APPT_RE.search(string.strip())
+    if m: return 'appt', m.group(1) or '', m.group(2)
+    return '', '', ''
+
+
+@dataclass
+class Waiter:
+    case: str
+    zip_code: str
+    code: str = ''
+    event: Event = field(default_factory=Event)
+
+    def accepts(self, case: str, zip_code: str) -> bool:
+        return case == self.case and (not zip_code or not self.zip_code or zip_code == self.zip_code)
+
+
+@dataclass
+class Inbox:
+    _waiters: List[Waiter] = field(init=False, default_factory=list)
+    _unclaimed: List[Tuple[float, str, str, str]] = field(init=False, default_factory=list)
+    _threads: Dict[str, Thread] = field(init=False, default_factory=dict)
+    _pending: Condition = field(init=False, default_factory=Condition)
+
+    def readers(self) -> Dict[str, Callable]:
+        readers = {}
+        if settings.ZULIP_ENABLED: readers['Zulip'] = zulip_read
+        if settings.TELEGRAM_ENABLED: readers['Telegram'] = telegram_read
+        return readers
+
+    def wait(self, case: str, zip_code: str = '', timeout: float = None) -> str:
+        """ Blocks until a reply for `case` addressed to `zip_code` (or to no
+        specific location) arrives; returns an empty string on timeout """
+        waiter = Waiter(case=case, zip_code=zip_code)
+        with self._pending:
+            self._claim(waiter)
+            if waiter.code: return waiter.code
+            self._waiters.append(waiter)
+            self._start()
+            self._pending.notify_all()
+
+        waiter.event.wait(timeout)
+        with self._pending:
+            if waiter in self._waiters: self._waiters.remove(waiter)
+        return waiter.code
+
+    def _claim(self, waiter: Waiter) -> None:
+        """ Hands a recently received, unclaimed reply to a new waiter """
+        self._unclaimed = [u for u in self._unclaimed if time() - u[0] <= UNCLAIMED_TTL]
+        for reply in self._unclaimed:
+            if waiter.accepts(*reply[1:3]):
+                self._unclaimed.remove(reply)
+                waiter.code = reply[3]
+                return
+
+    def _start(self) -> None:
+        for name, reader in self.readers().items():
+            if name in self._threads: continue
+            self._threads[name] = Thread(target=self._poll, args=(name, reader), name=f'inbox-{name}', daemon=True)
+            self._threads[name].start()
+
+    def _poll(self, name: str, reader: Callable) -> None:
+        while True:
+            with self._pending:
+                while not self._waiters: self._pending.wait()
+
+            timeout = settings.ALERT_POLL_TIMEOUT if settings.ALERT_LONG_POLLING else 0
+            start = time()
+            messages = reader(timeout) or []
+            for message in messages:
+                self.dispatch(message, name)
+            # Not long polling or backend failed right away – don't hammer it
+            if not messages and time() - start < 1: sleep(15)
+
+    def dispatch(self, message: str, backend: str = '') -> None:
+        """ Routes a reply to the longest waiting worker it is addressed to """
+        case, zip_code, code = parse_reply(message)
+        if not case: return
+        with self._pending:
+            for waiter in self._waiters:
+                if not waiter.accepts(case, zip_code): continue
+                self._waiters.remove(waiter)
+                waiter.code = code
+                waiter.event.set()
+                logger.info(f'Read {case.upper()} Code from {backend}: {code}')
+                return
+            self._unclaimed.append((time(), case, zip_code, code))
+
+
+inbox = Inbox()
+
+
+def read_backend(case: str, zip_code: str = '', timeout: float = None) -> str:
+    """ Waits for the SMS Code (`sms`) or appointment indicator (`appt`) sent
+    to any of the configured alerting backends and returns it as string """
+    return inbox.wait(case, zip_code, timeout)
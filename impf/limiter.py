@@ -0,0 +1,110 @@
+""" Adaptive per-server rate limiting – a token bucket per server id whose rate is increased
+additively while responses are clean and decreased multiplicatively on `429` (AIMD) """
+import logging
+from dataclasses import dataclass, field
+from threading import Lock
+from time import sleep, time
+from typing import Dict
+
+import settings
+from impf import metrics
+from impf.breaker import breaker
+from impf.state import state
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TokenBucket:
+    rate: float  # Requests per minute
+    minimum: float
+    maximum: float
+    increase: float  # Added to rate per clean response
+    decrease: float  # Factor applied to rate per `429`
+    _tokens: float = field(init=False, default=1)
+    _updated: float = field(init=False, default_factory=time)
+    _lock: Lock = field(init=False, default_factory=Lock)
+
+    def _refill(self) -> None:
+        now = time()
+        self._tokens = min(1, self._tokens + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    def delay(self) -> float:
+        """ Seconds until the next request may be sent """
+        with self._lock:
+            self._refill()
+            return max(0, (1 - self._tokens) * 60 / self.rate)
+
+    def acquire(self) -> float:
+        """ Reserves a token and blocks until it's due; returns seconds waited """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = max(0, -self._tokens * 60 / self.rate)
+        if wait: sleep(wait)
+        return wait
+
+    def success(self) -> None:
+        with self._lock:
+            self.rate = min(self.maximum, self.rate + self.increase)
+
+    def penalize(self) -> None:
+        """ Cuts the rate and drops saved up tokens, so the next request waits a full interval """
+        with self._lock:
+            self._refill()
+            self.rate = max(self.minimum, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_lock = Lock()
+
+
+def limiter(server: str) -> TokenBucket:
+    """ Returns the token bucket of a server id (001, 002, ...) """
+    with _lock:
+        if server not in _buckets:
+            _buckets[server] = TokenBucket(
+                rate=settings.RATE_LIMIT_INITIAL,
+                minimum=settings.RATE_LIMIT_MINIMUM,
+                maximum=settings.RATE_LIMIT_MAXIMUM,
+                increase=settings.RATE_LIMIT_INCREASE,
+                decrease=settings.RATE_LIMIT_DECREASE
+            )
+        return _buckets[server]
+
+
+def pace(seconds: int) -> None:
+    """ Fixed wait between checks – skipped if RATE_LIMIT_ENABLED, as the
+    next (throttled) request is paced by the rate limit instead """
+    if settings.RATE_LIMIT_ENABLED: return
+    sleep(seconds)
+
+
+def throttle(server: str) -> None:
+    """ Waits for the server's circuit breaker and rate limit if enabled """
+    state.wait_resumed(server)
+    if settings.CIRCUIT_BREAKER_ENABLED:
+        wait = breaker(server).acquire()
+        if wait >= 1: logger.debug(f'Waited {wait:.1f}s for circuit breaker of server [{server}]')
+    if not settings.RATE_LIMIT_ENABLED: return
+    wait = limiter(server).acquire()
+    if wait >= 1: logger.debug(f'Waited {wait:.1f}s for rate limit of server [{server}]')
+
+
+def feedback(server: str, too_many_requests: bool) -> None:
+    """ Reports a response to the server's circuit breaker and adjusts its rate limit if enabled """
+    if too_many_requests:
+        metrics.inc('impf_too_many_requests_total', server=server)
+        state.ban(server, settings.WAIT_SHADOW_BAN)
+    else:
+        state.unban(server)
+    if settings.CIRCUIT_BREAKER_ENABLED: breaker(server).record(too_many_requests)
+    if not settings.RATE_LIMIT_ENABLED: return
+    bucket = limiter(server)
+    if too_many_requests:
+        bucket.penalize()
+        logger.warning(f'Server [{server}] returned `429` - reducing rate to {bucket.rate:.2f} requests/min')
+    else:
+        bucket.success()
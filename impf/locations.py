@@ -0,0 +1,101 @@
+""" Live configuration of LOCATIONS – with LOCATIONS_RELOAD they are read from `locations.json`
+and changes to the file are applied while running: running browsers get their code swapped
+in place, new locations are scheduled and removed ones are dropped once their check finished """
+import json
+import logging
+import os
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, List
+from weakref import WeakSet
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+LOCATIONS_PATH = os.path.join(settings.WORK_DIR, 'locations.json')
+WAIT_RELOAD = 5  # Seconds between checking the file for changes
+
+generation = 0  # Increased on every change of LOCATIONS, so schedulers know when to re-plan
+_active = WeakSet()  # Browsers currently checking a location
+_lock = Lock()
+_mtime = 0
+
+
+def validate(locations: List[Dict]) -> None:
+    for location in locations:
+        if not str(location.get('location', ''))[:5].isdigit():
+            raise ValueError(f'Location "{location.get("location")}" does not start with a ZIP code')
+        if not isinstance(location.get('code', ''), str):
+            raise ValueError(f'Code of "{location.get("location")}" must be a string')
+
+
+def load() -> bool:
+    """ Replaces LOCATIONS with the content of `locations.json` if it changed;
+    keeps the current LOCATIONS if the file can't be read """
+    global generation, _mtime
+    try:
+        mtime = os.path.getmtime(LOCATIONS_PATH)
+        if mtime == _mtime: return False
+        with open(LOCATIONS_PATH, 'r', encoding='utf-8') as f:
+            locations = json.load(f)
+        validate(locations)
+    except (OSError, ValueError) as e:
+        logger.warning(f'Could not load {LOCATIONS_PATH} ({e}) - keeping current locations')
+        return False
+
+    with _lock:
+        _mtime = mtime
+        settings.LOCATIONS = [{**location, 'code': location.get('code', '')} for location in locations]
+        generation += 1
+    return True
+
+
+def apply() -> None:
+    """ Swaps the code of running browsers whose location got a new one """
+    codes = {location['location']: location['code'] for location in settings.LOCATIONS}
+    for browser in list(_active):
+        code = codes.get(browser.location)
+        if code and code != browser.code:
+            browser.logger.info(f'Code changed in {LOCATIONS_PATH} - continuing with {code}')
+            browser.code = code
+
+
+def watch() -> None:
+    """ Reads LOCATIONS from `locations.json` (created from settings.py on first start)
+    and reloads it in the background whenever it's changed """
+    if not os.path.exists(LOCATIONS_PATH):
+        with open(LOCATIONS_PATH, 'w', encoding='utf-8') as f:
+            json.dump(settings.LOCATIONS, f, indent=4, ensure_ascii=False)
+    load()
+    logger.info(f'LOCATIONS_RELOAD enabled - edit {LOCATIONS_PATH} to change locations and codes while running')
+
+    def _watch() -> None:
+        while True:
+            sleep(WAIT_RELOAD)
+            if not load(): continue
+            logger.info(f'Reloaded {len(settings.LOCATIONS)} locations from {LOCATIONS_PATH}')
+            apply()
+
+    Thread(target=_watch, name='locations', daemon=True).start()
+
+
+def attach(browser: 'Browser') -> None:
+    _active.add(browser)
+
+
+def detach(browser: 'Browser') -> None:
+    _active.discard(browser)
+
+
+def invalidate(location: Dict) -> None:
+    """ Unsets a code found invalid / used / expired at runtime, so it isn't probed again """
+    global generation
+    with _lock:
+        for _location in settings.LOCATIONS:
+            if _location['location'] == location['location'] and _location['code'] == location['code']:
+                _location['code'] = ''
+        for profile in settings.PROFILES:
+            codes = profile.get('codes', {})
+            if codes.get(location['location'][:5]) == location['code']: codes[location['location'][:5]] = ''
+        generation += 1
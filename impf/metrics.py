@@ -0,0 +1,103 @@
+""" Minimal Prometheus metrics – counters and histograms kept in memory and exported
+in the text exposition format on http://127.0.0.1:METRICS_PORT/metrics """
+import logging
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (.1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+HELP = {
+    'impf_step_seconds': 'Duration of browser workflow steps',
+    'impf_alert_latency_seconds': 'Time from seeing available appointments until all alerts were delivered',
+    'impf_too_many_requests_total': '429 responses by server',
+    'impf_session_refreshes_total': 'Cookie refreshes after the server signaled an invalid session',
+    'impf_control_errors_total': 'Exceptions caught while running the browser workflow',
+    'impf_alerts_total': 'Alerts sent by backend',
+    'impf_circuit_opened_total': 'Times the circuit breaker of a server opened after a `429`',
+}
+
+_lock = Lock()
+_counters: Dict[str, Dict[Tuple, float]] = {}
+_histograms: Dict[str, Dict[Tuple, List[float]]] = {}  # bucket counts, then sum and count
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        buckets = series.setdefault(key, [0] * (len(BUCKETS) + 2))
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound: buckets[i] += 1
+        buckets[-2] += value
+        buckets[-1] += 1
+
+
+def track_alert(futures: List[Future], seen: float, **labels) -> None:
+    """ Observes the time from `seen` until every backend delivered the alert """
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def delivered(_: Future) -> None:
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]: return
+        observe('impf_alert_latency_seconds', time() - seen, **labels)
+
+    if not futures: return observe('impf_alert_latency_seconds', time() - seen, **labels)
+    for future in futures: future.add_done_callback(delivered)
+
+
+def _labels(key: Tuple, **extra) -> str:
+    labels = [f'{k}="{v}"' for k, v in key] + [f'{k}="{v}"' for k, v in extra.items()]
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def render() -> str:
+    """ Returns all metrics in the Prometheus text exposition format """
+    lines = []
+    with _lock:
+        for name, series in _counters.items():
+            lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} counter']
+            lines += [f'{name}{_labels(key)} {value}' for key, value in series.items()]
+        for name, series in _histograms.items():
+            lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} histogram']
+            for key, buckets in series.items():
+                lines += [f'{name}_bucket{_labels(key, le=bound)} {buckets[i]}' for i, bound in enumerate(BUCKETS)]
+                lines.append(f'{name}_bucket{_labels(key, le="+Inf")} {buckets[-1]}')
+                lines.append(f'{name}_sum{_labels(key)} {buckets[-2]}')
+                lines.append(f'{name}_count{_labels(key)} {buckets[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def serve(port: int) -> None:
+    """ Starts the metrics endpoint in a background thread """
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f'Serving metrics on http://127.0.0.1:{port}/metrics')
@@ -0,0 +1,44 @@
+""" Auto-booking policy – picks the appointment to book from the `termine` returned by
+the REST API according to AUTO_BOOK_RULES, so no reply via chat has to be awaited """
+from datetime import date, datetime
+from typing import List
+
+import settings
+
+DEFAULT_RULES = {
+    'order': 'earliest',
+    'earliest': '',
+    'latest': '',
+    'weekdays': [0, 1, 2, 3, 4, 5, 6],
+    'min_gap': 0,
+    'centers': [],
+}
+
+
+def _day(termin: dict) -> datetime:
+    return datetime.fromtimestamp(termin.get('begin') / 1000)
+
+
+def _date(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def matches(pair: List[dict], rules: dict) -> bool:
+    """ Checks if a pair of appointments (1st and 2nd shot) satisfies the rules """
+    days = [_day(termin) for termin in pair]
+    if rules['earliest'] and days[0].date() < _date(rules['earliest']): return False
+    if rules['latest'] and days[0].date() > _date(rules['latest']): return False
+    if any(day.weekday() not in rules['weekdays'] for day in days): return False
+    if len(days) > 1 and (days[1] - days[0]).days < rules['min_gap']: return False
+    return True
+
+
+def pick(termine: List[List[dict]], zip_code: str, rules: dict = None) -> int:
+    """ Returns the number of the appointment to book (as in `appt:N`); 0 if none matches """
+    rules = {**DEFAULT_RULES, **(settings.AUTO_BOOK_RULES if rules is None else rules)}
+    if rules['centers'] and zip_code not in rules['centers']: return 0
+
+    candidates = [i for i, pair in enumerate(termine or []) if pair and matches(pair, rules)]
+    if not candidates: return 0
+    candidates.sort(key=lambda i: _day(termine[i][0]), reverse=rules['order'] == 'latest')
+    return candidates[0] + 1
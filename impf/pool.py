@@ -0,0 +1,74 @@
+""" Pool of warm browsers – Chrome cold starts are the biggest fixed cost of each check,
+so in concurrent mode browsers are checked out, reinitialized and returned instead """
+import logging
+from dataclasses import dataclass, field
+from queue import Queue, Empty
+from threading import Lock
+from typing import Dict
+
+from impf.browser import Browser
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BrowserPool:
+    size: int  # Maximum amount of browsers alive at the same time
+    max_uses: int = 0  # Evict browsers after n checks; 0 to reuse forever
+    _idle: Queue = field(init=False, default_factory=Queue)
+    _uses: Dict[int, int] = field(init=False, default_factory=dict)
+    _started: int = field(init=False, default=0)
+    _lock: Lock = field(init=False, default_factory=Lock)
+
+    def warm_up(self) -> None:
+        """ Starts all browsers upfront – one after another to avoid CPU spikes """
+        logger.info(f'Warming up {self.size} browsers')
+        while self._started < self.size:
+            self._idle.put(self._start())
+
+    def _start(self) -> Browser:
+        with self._lock: self._started += 1
+        try:
+            x = Browser(location='', code='')
+        except:
+            with self._lock: self._started -= 1
+            raise
+        self._uses[id(x)] = 0
+        return x
+
+    def _evict(self, x: Browser, quit: bool = True) -> None:
+        self._uses.pop(id(x), None)
+        with self._lock: self._started -= 1
+        if not quit: return
+        try: x.driver.quit()
+        except: pass
+
+    def acquire(self, location: Dict) -> Browser:
+        """ Checks out a healthy browser for `location`; blocks if all browsers are in use """
+        while True:
+            try:
+                x = self._idle.get_nowait()
+            except Empty:
+                with self._lock: exhausted = self._started >= self.size
+                x = self._idle.get() if exhausted else self._start()
+
+            if x.alive: break
+            logger.info('Pooled browser is no longer reachable - replacing it')
+            self._evict(x)
+
+        x.reinit(**location)
+        return x
+
+    def release(self, x: Browser) -> None:
+        """ Returns a browser to the pool or evicts it """
+        if x.keep_browser:
+            # Appointments found or KEEP_BROWSER_CRASH – leave it open for the user
+            return self._evict(x, quit=False)
+
+        self._uses[id(x)] = self._uses.get(id(x), 0) + 1
+        if self.max_uses and self._uses[id(x)] >= self.max_uses:
+            logger.info(f'Pooled browser was used {self._uses[id(x)]} times - evicting it')
+            return self._evict(x)
+        if not x.alive:
+            return self._evict(x)
+        self._idle.put(x)
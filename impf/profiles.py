@@ -0,0 +1,88 @@
+""" Multiple people (household, team) with their own Vermittlungscodes and booking data – every
+location is still polled only once and appointments found are booked for each profile which has
+a code for the location's server, so N people cost about the same requests as one """
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('BIRTHDATE', 'PHONE', 'MAIL', 'SALUTATION', 'FIRST_NAME', 'LAST_NAME',
+          'STREET_NAME', 'HOUSE_NUMBER', 'CITY', 'ZIP_CODE')
+
+
+@dataclass
+class Profile:
+    name: str
+    codes: Dict[str, str]  # Vermittlungscode by ZIP code of the location
+    data: Dict[str, str] = field(default_factory=dict)  # FIELDS; missing ones default to settings
+    primary: bool = False  # Profile configured at the top of `settings.py`
+
+    def __getattr__(self, item: str) -> str:
+        if item not in FIELDS: raise AttributeError(item)
+        return self.data.get(item, getattr(settings, item))
+
+    @property
+    def contact(self) -> Dict[str, str]:
+        """ Contact data as expected by the booking endpoint """
+        return {
+            'anrede': self.SALUTATION,
+            'vorname': self.FIRST_NAME,
+            'nachname': self.LAST_NAME,
+            'strasse': self.STREET_NAME,
+            'hausnummer': self.HOUSE_NUMBER,
+            'plz': self.ZIP_CODE,
+            'ort': self.CITY,
+            'phone': f'+49 {self.PHONE}',
+            'notificationReceiver': self.MAIL,
+            'notificationChannel': 'email'
+        }
+
+    def code(self, zip_code: str) -> str:
+        """ Vermittlungscode usable for a location – a code is valid for
+        every center hosted on the same server """
+        if self.codes.get(zip_code): return self.codes[zip_code]
+        if not any(self.codes.values()): return ''
+        from impf.centers import catalog
+        server = catalog.server_id(zip_code)
+        if not server: return ''
+        return next((code for _zip, code in self.codes.items() if code and catalog.server_id(_zip) == server), '')
+
+
+def default() -> Profile:
+    """ The profile configured at the top of `settings.py` """
+    codes = {location['location'][:5]: location.get('code', '') for location in settings.LOCATIONS}
+    return Profile(name=settings.FIRST_NAME, codes=codes, primary=True)
+
+
+def profiles() -> List[Profile]:
+    _profiles = [default()]
+    for i, profile in enumerate(settings.PROFILES):
+        data = {k: v for k, v in profile.items() if k in FIELDS}
+        _profiles.append(Profile(name=profile.get('name', f'Profile {i + 2}'), codes=profile.get('codes', {}), data=data))
+    return _profiles
+
+
+def subscribers(zip_code: str, code: str = '') -> List[Tuple[Profile, str]]:
+    """ Profiles with a code for the location and their code – the one owning
+    `code` (i.e. the code the location is polled with) first """
+    _subscribers = [(profile, profile.code(zip_code)) for profile in profiles()]
+    _subscribers = [(profile, _code) for profile, _code in _subscribers if _code]
+    return sorted(_subscribers, key=lambda s: s[1] != code)
+
+
+def locations() -> List[Dict]:
+    """ LOCATIONS to poll – a location without code is polled with the first
+    code another profile has for it """
+    _locations = []
+    for location in settings.LOCATIONS:
+        if not location.get('code'):
+            code = next((p.codes.get(location['location'][:5]) for p in profiles()[1:]
+                         if p.codes.get(location['location'][:5])), '')
+            if code:
+                logger.info(f'Polling {location["location"]} with code {code} of another profile')
+                location = {**location, 'code': code}
+        _locations.append(location)
+    return _locations
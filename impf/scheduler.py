@@ -0,0 +1,29 @@
+""" Scheduling helpers for the configured LOCATIONS """
+import logging
+from typing import Dict, List
+
+from impf.centers import catalog
+
+logger = logging.getLogger(__name__)
+
+
+def group_locations(locations: List[Dict]) -> List[Dict]:
+    """ Groups locations with a Vermittlungscode by the server their center is hosted on. A
+    Vermittlungscode is valid for every center on the same server, so one session per server is
+    enough to search appointments for all of the server's centers (`zip_codes`) """
+    groups: Dict[str, Dict] = {}
+    scheduled = []
+    for location in locations:
+        zip_code = location.get('location', '')[:5]
+        server = catalog.server_id(zip_code) if location.get('code') else ''
+        if not server:
+            scheduled.append(location)
+        elif server in groups:
+            groups[server]['zip_codes'].append(zip_code)
+        else:
+            groups[server] = {**location, 'zip_codes': [zip_code]}
+            scheduled.append(groups[server])
+
+    for server, group in groups.items():
+        logger.info(f'Server [{server}]: checking {", ".join(group["zip_codes"])} with code {group["code"]}')
+    return scheduled
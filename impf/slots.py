@@ -0,0 +1,61 @@
+""" Change detection for appointments – keeps a compact fingerprint (`slotId`, `begin`) of the
+slots last returned for each center, so rescans only alert and re-plan if slots appeared and
+tell the user which ones are new and which are gone """
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock
+from typing import Dict, FrozenSet, List, Tuple
+
+from impf.constructors import _format_appointments
+
+logger = logging.getLogger(__name__)
+
+Fingerprint = FrozenSet[Tuple[str, int]]
+
+
+def fingerprint(termine: List[List[dict]]) -> Fingerprint:
+    return frozenset((termin.get('slotId'), termin.get('begin')) for pair in termine or [] for termin in pair)
+
+
+@dataclass
+class SlotChanges:
+    new: List[List[dict]]  # Appointment pairs with at least one slot not seen before
+    gone: List[Tuple[str, int]]  # Slots not returned anymore
+
+    def __bool__(self) -> bool:
+        return bool(self.new)
+
+    def summary(self) -> str:
+        lines = [f'New: {_format_appointments(pair)}' for pair in self.new]
+        if self.gone:
+            gone = sorted(begin for _, begin in self.gone)
+            lines.append('Gone: ' + ', '.join(datetime.fromtimestamp(b / 1000).strftime('%a, %d.%m. %H:%M') for b in gone))
+        return '  \n'.join(lines)
+
+
+@dataclass
+class SlotTracker:
+    _seen: Dict[str, Fingerprint] = field(init=False, default_factory=dict)
+    _lock: Lock = field(init=False, default_factory=Lock)
+
+    def diff(self, zip_code: str, termine: List[List[dict]]) -> SlotChanges:
+        """ Returns what changed since the slots of a center were last stored """
+        current = fingerprint(termine)
+        with self._lock:
+            seen = self._seen.get(zip_code, frozenset())
+        new = [pair for pair in termine or [] if fingerprint([pair]) - seen]
+        return SlotChanges(new=new, gone=sorted(seen - current))
+
+    def store(self, zip_code: str, termine: List[List[dict]]) -> None:
+        """ Marks the slots of a center as seen – only once the user was alerted about them """
+        with self._lock:
+            self._seen[zip_code] = fingerprint(termine)
+
+    def update(self, zip_code: str, termine: List[List[dict]]) -> SlotChanges:
+        changes = self.diff(zip_code, termine)
+        self.store(zip_code, termine)
+        return changes
+
+
+tracker = SlotTracker()
@@ -0,0 +1,110 @@
+""" Crash-safe runtime state in SQLite (`state.db`, write-ahead logging) – codes found invalid,
+`429` bans per server and when each location was last checked, so a restart neither re-probes
+dead codes nor walks back into an active ban """
+import logging
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from threading import RLock
+from time import sleep, time
+from typing import Dict, Set, Tuple
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = os.path.join(settings.WORK_DIR, 'state.db')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS codes (location TEXT, code TEXT, reason TEXT, t REAL, PRIMARY KEY (location, code));
+CREATE TABLE IF NOT EXISTS bans (server TEXT PRIMARY KEY, until REAL);
+CREATE TABLE IF NOT EXISTS checks (location TEXT PRIMARY KEY, server TEXT, outcome TEXT, t REAL);
+"""
+
+
+@dataclass
+class StateStore:
+    path: str
+    _conn: sqlite3.Connection = field(init=False, default=None)
+    _invalid: Set[Tuple[str, str]] = field(init=False, default_factory=set)  # (ZIP code, code)
+    _bans: Dict[str, float] = field(init=False, default_factory=dict)
+    _resumed: Dict[str, float] = field(init=False, default_factory=dict)  # Bans of the previous run
+    _checked: Dict[str, float] = field(init=False, default_factory=dict)
+    # Reentrant, as the SIGTERM handler checkpoints on the main thread, which may be writing itself
+    _lock: RLock = field(init=False, default_factory=RLock)
+
+    def open(self) -> bool:
+        """ Opens the database and loads the state of the previous run """
+        if not settings.STATE_ENABLED: return False
+        with self._lock:
+            if self._conn: return True
+            try:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute('PRAGMA synchronous=NORMAL')
+                self._conn.executescript(SCHEMA)
+                self._invalid = {(l, c) for l, c in self._conn.execute('SELECT location, code FROM codes')}
+                self._bans = dict(self._conn.execute('SELECT server, until FROM bans WHERE until > ?', (time(),)))
+                self._checked = dict(self._conn.execute('SELECT location, t FROM checks'))
+            except sqlite3.Error:
+                logger.exception(f'Could not open state {self.path} - continuing without it')
+                self._conn = None
+                return False
+            self._resumed = dict(self._bans)
+        for server, until in self._resumed.items():
+            logger.info(f'Server [{server}] is banned until {int(until - time()) // 60}min from now (previous run)')
+        return True
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            if not self._conn: return
+            try:
+                self._conn.execute(sql, params)
+            except sqlite3.Error:
+                logger.exception(f'Could not write state to {self.path}')
+
+    def invalidate(self, zip_code: str, code: str, reason: str) -> None:
+        self._invalid.add((zip_code, code))
+        self._write('INSERT OR REPLACE INTO codes VALUES (?, ?, ?, ?)', (zip_code, code, reason, time()))
+
+    def valid(self, zip_code: str, code: str) -> bool:
+        return (zip_code, code) not in self._invalid
+
+    def ban(self, server: str, seconds: float) -> None:
+        self._bans[server] = time() + seconds
+        self._write('INSERT OR REPLACE INTO bans VALUES (?, ?)', (server, self._bans[server]))
+
+    def unban(self, server: str) -> None:
+        """ The server answered again – drops a ban that would otherwise be resumed """
+        if self._bans.get(server, 0) < time(): return
+        del self._bans[server]
+        self._write('DELETE FROM bans WHERE server = ?', (server,))
+
+    def wait_resumed(self, server: str) -> None:
+        """ Waits out a ban of the previous run before the first request to the server """
+        until = self._resumed.get(server, 0)
+        if until <= time():
+            self._resumed.pop(server, None)
+            return
+        logger.info(f'Waiting {int(until - time()) // 60}min for the ban of server [{server}] of the previous run')
+        sleep(max(0, until - time()))
+
+    def checked(self, zip_code: str, server: str, outcome: str) -> None:
+        self._checked[zip_code] = time()
+        self._write('INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?)', (zip_code, server, outcome, time()))
+
+    def last_checked(self, zip_code: str) -> float:
+        return self._checked.get(zip_code, 0)
+
+    def checkpoint(self) -> None:
+        """ Merges the write-ahead log into the database and closes it """
+        with self._lock:
+            if not self._conn: return
+            try:
+                self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                self._conn.close()
+            except sqlite3.Error:
+                logger.exception(f'Could not checkpoint state {self.path}')
+            self._conn = None
+
+
+state = StateStore(path=STATE_PATH)
@@ -0,0 +1,137 @@
+""" Shared HTTP transport for REST API, center catalog and alert traffic – every session is
+mounted on the same keep-alive connection pools (one per host, sized by the number of workers),
+so TLS handshakes are paid once per connection instead of once per `API()`. Requests without
+an explicit timeout get CONNECT_TIMEOUT / READ_TIMEOUT. With HTTP2_ENABLED the pools are
+provided by httpx (`pip install httpx[http2]`) """
+import logging
+from http.client import HTTPMessage
+from threading import Lock
+from types import SimpleNamespace
+from typing import Dict
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import settings
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+_adapter = None
+_shared = None
+_lock = Lock()
+
+
+def default_timeout() -> tuple:
+    return settings.CONNECT_TIMEOUT, settings.READ_TIMEOUT
+
+
+def pool_size() -> int:
+    """ Connections kept per host – one per worker sending requests simultaneously,
+    plus some for alerts and the inbox readers """
+    workers = settings.CONCURRENT_WORKERS if settings.CONCURRENT_ENABLED or settings.ASYNC_ENABLED else 1
+    if settings.ASYNC_ENABLED: workers = max(workers, settings.ASYNC_MAX_REQUESTS)
+    return workers + 2
+
+
+class PooledAdapter(HTTPAdapter):
+    """ urllib3 connection pools with default timeouts """
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout or default_timeout(), **kwargs)
+
+    def close(self) -> None:
+        pass  # Shared by all sessions – closing one session must not drop everyone's connections
+
+
+class _Raw:
+    """ Just enough of a urllib3 response for requests to extract cookies and close it """
+    def __init__(self, headers: 'httpx.Headers'):
+        msg = HTTPMessage()
+        for name, value in headers.multi_items():
+            msg[name] = value
+        self._original_response = SimpleNamespace(msg=msg)
+
+    def release_conn(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class HTTP2Adapter(BaseAdapter):
+    """ Sends the requests of a requests.Session over httpx' HTTP/2 connection pools – on
+    transport level, so cookies and redirects are still handled by each requests.Session """
+    def __init__(self, pool_maxsize: int):
+        super().__init__()
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=pool_maxsize)
+        self.transport = httpx.HTTPTransport(http2=True, limits=limits)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        timeout = timeout or default_timeout()
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        headers = dict(request.headers)
+        headers['Accept-Encoding'] = 'gzip, deflate'  # br requires the optional brotli package
+        _request = httpx.Request(request.method, request.url, headers=headers, content=request.body,
+                                 extensions={'timeout': httpx.Timeout(read, connect=connect).as_dict()})
+        try:
+            r = self.transport.handle_request(_request)
+            try:
+                content = r.read()
+            finally:
+                r.close()
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e, request=request)
+
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.headers = CaseInsensitiveDict(r.headers.items())
+        response.headers.pop('Content-Encoding', None)  # already decoded by httpx
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.reason = r.extensions.get('reason_phrase', b'').decode('ascii', 'ignore')
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.raw = _Raw(r.headers)
+        response._content = content
+        return response
+
+    def close(self) -> None:
+        pass  # Shared by all sessions – closing one session must not drop everyone's connections
+
+
+def adapter() -> BaseAdapter:
+    """ The transport adapter shared by all sessions """
+    global _adapter
+    with _lock:
+        if _adapter is None:
+            if settings.HTTP2_ENABLED and httpx is None:
+                logger.warning('HTTP2_ENABLED requires httpx - run `pip install httpx[http2]`; using HTTP/1.1')
+            if settings.HTTP2_ENABLED and httpx is not None:
+                _adapter = HTTP2Adapter(pool_maxsize=pool_size())
+            else:
+                _adapter = PooledAdapter(pool_connections=32, pool_maxsize=pool_size())
+        return _adapter
+
+
+def session(headers: Dict[str, str] = None) -> requests.Session:
+    """ New session (own cookies and headers) on the shared connection pools """
+    s = requests.Session()
+    s.mount('https://', adapter())
+    s.mount('http://', adapter())
+    if headers: s.headers.update(headers)
+    return s
+
+
+def shared() -> requests.Session:
+    """ Session for stateless requests, e.g. the center catalog """
+    global _shared
+    if _shared is None: _shared = session()
+    return _shared
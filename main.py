@@ -1,20 +1,29 @@
 import argparse
+import asyncio
 import concurrent.futures
 from concurrent.futures import FIRST_COMPLETED
-from time import sleep
 from datetime import datetime, timedelta
 import logging
+import os
+import signal
 try: import readline
 except: pass
 
 import settings
 from impf import __version__ as v
+from impf import aio, coordinator, events, locations, metrics, profiles
 from impf.alert import send_alert
 from impf.api import API
 from impf.browser import Browser
+from impf.constructors import service_url
+from impf.limiter import pace
+from impf.pool import BrowserPool
+from impf.scheduler import group_locations
+from impf.state import state
 
 logger = logging.getLogger(__name__)
 b = None  # helper variable for keeping browser open
+pool = None  # warm browsers for CONCURRENT_ENABLED if POOL_ENABLED
 
 
 def print_config() -> None:
@@ -29,6 +38,11 @@ def print_config() -> None:
         print(f'- {settings.SALUTATION} {settings.FIRST_NAME} {settings.LAST_NAME}')
         print(f'- {settings.STREET_NAME} {settings.HOUSE_NUMBER}')
         print(f'- {settings.ZIP_CODE} {settings.CITY}')
+    if settings.PROFILES:
+        print('[x] Profiles')
+        for profile in profiles.profiles():
+            codes = [f'{zip_code}: {code}' for zip_code, code in profile.codes.items() if code]
+            print(f'- {profile.name} ({profile.MAIL}): {", ".join(codes) or "No code configured"}')
     print('[x] Alerting Methods')
     if settings.COMMAND_ENABLED: print('- Custom Command ✓')
     if settings.ZULIP_ENABLED: print('- Zulip ✓')
@@ -70,7 +84,7 @@ def instant_code() -> None:
         x.waiting_room()
         x.inject_session()
         x.location_page()
-        x.driver.get(f'https://{x.server_id}-iz.impfterminservice.de/impftermine/check')
+        x.driver.get(f'{service_url(x.server_id)}/impftermine/check')
         x.claim_code()
 
         input('Please continue manually... press Enter to continue trying via API if this doesn\'t work! (Press CTRL+C to exit) ')
@@ -91,7 +105,7 @@ def instant_code() -> None:
 def impf_me(location: dict):
     """ Helper function to support concurrency """
     global b  # Open Browser Helper variable
-    x = b or Browser(**location)
+    x = b or (pool.acquire(location) if pool else Browser(**location))
 
     # Keep Browser open
     if settings.KEEP_BROWSER and not (settings.CONCURRENT_ENABLED):
@@ -103,19 +117,118 @@ def impf_me(location: dict):
             x.reinit(**location)
 
     # Continue with normal loop
-    try: x.control_main()
-    except RecursionError: pass
+    locations.attach(x)
+    try:
+        x.control_main()
+    finally:
+        locations.detach(x)
+    # Captured before releasing – another worker may reinit the browser for its location
+    server, outcome = x.checked
+    result = {'location': x.location, 'code': x.code, 'zip_codes': x.zip_codes, 'server': server, 'outcome': outcome}
+
+    if pool: pool.release(x)
+    if not settings.RATE_LIMIT_ENABLED:
+        logger.info(f'Waiting until {(datetime.now() + timedelta(seconds=settings.WAIT_LOCATIONS)).strftime("%H:%M:%S")} '
+                    f'before checking the next location')
+    pace(settings.WAIT_LOCATIONS)
+    if not (x.keep_browser or pool): x.driver.quit()
+    return result
+
+
+def warm_pool() -> None:
+    global pool
+    if settings.POOL_ENABLED and (settings.CONCURRENT_ENABLED or settings.ASYNC_ENABLED):
+        pool = BrowserPool(size=settings.CONCURRENT_WORKERS, max_uses=settings.POOL_MAX_USES)
+        pool.warm_up()
+
+
+def resume(location: dict) -> dict:
+    """ Unsets a code found invalid / used / expired in a previous run """
+    if location.get('code') and not state.valid(location['location'][:5], location['code']):
+        logger.info(f'{location["location"]}: code {location["code"]} was found invalid before - not using it')
+        return {**location, 'code': ''}
+    return location
+
+
+def terminate(signum, frame) -> None:
+    """ Checkpoints the state before exiting on SIGTERM """
+    state.checkpoint()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def scheduled_locations() -> list:
+    """ LOCATIONS to check – grouped by server if GROUP_BY_SERVER """
+    _locations = [resume(location) for location in profiles.locations()]
+    _locations.sort(key=lambda location: state.last_checked(location['location'][:5]))
+    if not settings.GROUP_BY_SERVER: return _locations
+    if settings.HYBRID_ENABLED: return group_locations(_locations)
+    logger.warning('GROUP_BY_SERVER requires HYBRID_ENABLED - checking all locations individually')
+    return _locations
+
+
+def work(url: str) -> None:
+    """ Checks locations leased from the coordinator at `url` until stopped """
+    warm_pool()
+    workers = settings.CONCURRENT_WORKERS if settings.CONCURRENT_ENABLED else 1
+    if settings.ASYNC_ENABLED: logger.warning('ASYNC_ENABLED is not supported as worker - using browsers instead')
+    coordinator.Worker(url).run(impf_me, workers)
+
+
+def run() -> None:
+    """ Checks all LOCATIONS until stopped """
+    warm_pool()
+    generation = locations.generation
+    scheduled = scheduled_locations()
+
+    if settings.ASYNC_ENABLED:
+        logger.info(f'ASYNC_ENABLED set with {settings.CONCURRENT_WORKERS} simultaneous browsers and '
+                    f'{settings.ASYNC_MAX_REQUESTS} simultaneous API requests')
+        asyncio.run(aio.run(scheduled, pool))
+
+    elif settings.CONCURRENT_ENABLED:
+        logger.info(f'CONCURRENT_ENABLED set with {settings.CONCURRENT_WORKERS} simultaneous workers')
+        if not settings.RATE_LIMIT_ENABLED: logger.info(f'Spawning Browsers with {settings.WAIT_CONCURRENT}s delay.')
+        with concurrent.futures.ThreadPoolExecutor(max_workers=settings.CONCURRENT_WORKERS) as executor:
+            futures = {}
+            for location in scheduled:
+                futures[executor.submit(impf_me, location)] = location
+                pace(settings.WAIT_CONCURRENT)
 
-    logger.info(f'Waiting until {(datetime.now() + timedelta(seconds=settings.WAIT_LOCATIONS)).strftime("%H:%M:%S")} '
-                f'before checking the next location')
-    sleep(settings.WAIT_LOCATIONS)
-    if not x.keep_browser: x.driver.quit()
-    return {'location': x.location, 'code': x.code}
+            while futures:
+                done, _ = concurrent.futures.wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    location = futures.pop(future)
+                    # If Vermittlungscode is invalid/already used, it is unset during Browser
+                    # runtime, let's make sure we unset it for the next iteration
+                    if location.get('code') and not future.result().get('code'): locations.invalidate(location)
+
+                # Re-plan if LOCATIONS changed – finished locations are scheduled with their current
+                # config, new ones are added and removed ones aren't scheduled again
+                if generation != locations.generation:
+                    generation, scheduled = locations.generation, scheduled_locations()
+                running = [location['location'] for location in futures.values()]
+                for location in scheduled:
+                    if location['location'] in running: continue
+                    futures[executor.submit(impf_me, location)] = location
+
+    else:
+        while True:
+            for location in scheduled:
+                _location = impf_me(location)
+                if location.get('code') and not _location.get('code'): locations.invalidate(location)
+
+            if generation != locations.generation:
+                generation, scheduled = locations.generation, scheduled_locations()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--alerts', help='Check all alert backends and exit', action='store_true')
+    parser.add_argument('--analyze', help='Analyze recorded events and write the polling profile', action='store_true')
+    parser.add_argument('--coordinator', help='Hand out LOCATIONS to workers on other hosts', action='store_true')
+    parser.add_argument('--worker', metavar='URL', help='Check locations leased from the coordinator at URL')
     parser.add_argument('--code', help='Instant Vermittlungscode Generator (works best from 23:00 to 07:00)', action='store_true')
     parser.add_argument('--manual', help='Undocumented super function', action='store_true')
     parser.add_argument('--surf', help='Interactive Surf Session for Cookie Enrichment', action='store_true')
@@ -123,46 +236,17 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     if args.version: print_version(); exit()
+    if args.analyze: events.analyze(); exit()
     if args.alerts: print_config(); send_alert('Notification test from Impf Bot.py - https://github.com/alfonsrv/impf-botpy'); exit()
 
     logger.info(f'Starting up Impf Bot.py - github/@alfonsrv, 05/2021 (version {v})')
     if args.code: instant_code(); exit()
     if args.manual: print('Try in combination with --code'); exit()
     elif args.surf: x = Browser(location='', code=''); input('Press Enter to end interactive session'); x.driver.quit(); exit()
+    if state.open(): signal.signal(signal.SIGTERM, terminate)
+    if settings.METRICS_ENABLED: metrics.serve(settings.METRICS_PORT)
+    if settings.LOCATIONS_RELOAD: locations.watch()
+    if args.coordinator: coordinator.serve(scheduled_locations(), settings.COORDINATOR_PORT); exit()
     print_config()
-
-    if settings.CONCURRENT_ENABLED:
-        logger.info(f'CONCURRENT_ENABLED set with {settings.CONCURRENT_WORKERS} simultaneous workers')
-        logger.info(f'Spawning Browsers with {settings.WAIT_CONCURRENT}s delay.')
-        locations = settings.LOCATIONS
-        with concurrent.futures.ThreadPoolExecutor(max_workers=settings.CONCURRENT_WORKERS) as executor:
-            # futures = [executor.submit(impf_me, location) for location in settings.LOCATIONS]
-            futures = []
-            for location in settings.LOCATIONS:
-                futures.append(executor.submit(impf_me, location))
-                sleep(settings.WAIT_CONCURRENT)
-
-            while futures:
-                done, _ = concurrent.futures.wait(futures, return_when=FIRST_COMPLETED)
-
-                for future in done:
-                    futures.remove(future)
-                    _location = future.result()
-
-                    futures.append(executor.submit(impf_me, _location))
-                    del future
-
-    else:
-        while True:
-            for location in settings.LOCATIONS:
-                _location = impf_me(location)
-
-                # If Vermittlungscode is invalid/already used, it is unset during Browser
-                # runtime, let's make sure we unset it for the next iteration
-                if _location.get('code') != location.get('code'):
-                    # Get Index of Location in settings-Location List
-                    idx = next((index for (index, d) in enumerate(settings.LOCATIONS)
-                                if d["location"] == location['location']
-                                and d['code'] == location['code']),
-                               None)
-                    if idx: settings.LOCATIONS[idx]['code'] = ''
+    if args.worker: work(args.worker); exit()
+    run()
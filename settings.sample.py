@@ -22,6 +22,10 @@ LOCATIONS: List[Dict[str, str]] = [
         'code': ''
     },
 ]
+# Read LOCATIONS from `locations.json` in WORK_DIR instead (created from the list above on first start) and apply
+# changes to the file while running – e.g. add the code you got via mail without restarting. Browsers keep their
+# session; new locations are scheduled right away. Not supported with ASYNC_ENABLED
+LOCATIONS_RELOAD: bool = False
 
 # DD.MM.YYYY
 BIRTHDATE: str = '31.12.1994'
@@ -42,6 +46,24 @@ CITY: str = 'Stuttgart'
 ZIP_CODE: str = '70173'
 
 
+# > Profiles
+# Further people (household, team) to book for – each location is still polled only once and appointments found
+# are booked for everyone with a Vermittlungscode for the location, one after the other. `codes` maps the ZIP code
+# of a location in LOCATIONS to the person's Vermittlungscode; a code is valid for all centers on the same server.
+# Data left out (e.g. the address) is taken from the settings above.
+PROFILES: List[Dict] = [
+    # {
+    #     'name': 'Erika',
+    #     'codes': {'71636': 'Q456-EFGH-C0DE'},
+    #     'BIRTHDATE': '01.01.1990',
+    #     'PHONE': '1514201338',
+    #     'MAIL': 'erika@ent-spahnen.de',
+    #     'SALUTATION': 'Frau',
+    #     'FIRST_NAME': 'Erika',
+    #     'LAST_NAME': 'Mustermann',
+    # },
+]
+
 # > Waiting Times
 # ----------------------
 # Seconds before checking next location
@@ -62,13 +84,39 @@ WAIT_API_CALLS: int = 60*1  # 1 Min
 # Seconds to wait before rechecking available appointments.
 # Only relevant if RESCAN_APPOINTMENT is set to True
 WAIT_RESCAN_APPOINTMENTS: int = 60*2  # 2 Min
+# Seconds to wait between two REST API appointment searches.
+# Only relevant if HYBRID_ENABLED is set to True
+WAIT_HYBRID_POLLING: int = 20
+
+
+# > Rate Limiting
+# ----------------------
+# Adaptive rate limit per server instead of the fixed WAIT_LOCATIONS, WAIT_CONCURRENT, WAIT_HYBRID_POLLING,
+# WAIT_RESCAN_APPOINTMENTS and WAIT_SHADOW_BAN waiting times. The rate is slowly increased while the server
+# responds normally and cut whenever it returns `429` - keeping the bot at the highest rate that's still safe
+RATE_LIMIT_ENABLED: bool = False
+# Requests per minute and server to start with
+RATE_LIMIT_INITIAL: float = 6
+# Lower and upper bound of requests per minute and server
+RATE_LIMIT_MINIMUM: float = 0.1
+RATE_LIMIT_MAXIMUM: float = 30
+# Requests per minute added for every successful request
+RATE_LIMIT_INCREASE: float = 0.5
+# Factor the rate is multiplied with on `429`
+RATE_LIMIT_DECREASE: float = 0.5
 
 
 # > Basic Features
 # ----------------------
 # Keep the same browser window for checking all locations; makes it easier to run in background
-# Cannot be used in combination with `CONCURRENT_ENABLED` (ignored if CONCURRENT_ENABLED)
+# Cannot be used in combination with `CONCURRENT_ENABLED` (ignored if CONCURRENT_ENABLED – see POOL_ENABLED)
 KEEP_BROWSER: bool = True
+# A `429` pauses the requests of all browsers and API sessions to that server for CIRCUIT_BREAKER_COOLDOWN, so the
+# other workers don't prolong the ban. Afterwards a single probe request is sent: if it's answered, everyone
+# continues – otherwise the pause is doubled (up to CIRCUIT_BREAKER_MAXIMUM)
+CIRCUIT_BREAKER_ENABLED: bool = False
+CIRCUIT_BREAKER_COOLDOWN: int = WAIT_SHADOW_BAN
+CIRCUIT_BREAKER_MAXIMUM: int = 60*60  # 1h
 # Checks if the backend is returning error `429` (Too Many Requests) and then sleeps for WAIT_SHADOW_BAN
 # seconds before sending the last request again.
 AVOID_SHADOW_BAN: bool = True
@@ -79,6 +127,9 @@ AVOID_SHADOW_BAN: bool = True
 # in an undesired behavior; if CONCURRENT_ENABLED is not used the bot will evidently only keep on
 # checking only one center over and over again.
 RESCAN_APPOINTMENT: bool = True
+# Only alert again for a center if slots appeared that weren't returned before – the alert lists which slots are
+# new and which are gone. Slots are read via REST API – without HYBRID_ENABLED once the browser found appointments
+ALERT_CHANGES_ONLY: bool = True
 # Pause bot during night times (2300-0600) since no new appointments are created anyways during
 # that time period. Can help reduce shadow bans
 SLEEP_NIGHT: bool = True
@@ -88,6 +139,18 @@ SLEEP_NIGHT: bool = True
 # If this feature is enabled, manual bookings are also still possible.
 # Note: This is an experimental feature; but should be stable.
 BOOK_REMOTELY: bool = False
+# Book the appointment best matching AUTO_BOOK_RULES right away – without waiting for your `appt:N` reply.
+# Only appointments matching all rules are booked; if none matches you're asked as usual (given BOOK_REMOTELY).
+# Careful: the booking is final and your Vermittlungscode is used up
+AUTO_BOOK: bool = False
+AUTO_BOOK_RULES: dict = {
+    'order': 'earliest',  # book the `earliest` or `latest` matching appointment
+    'earliest': '',  # first shot not before this date, e.g. '2021-06-01'; '' for no limit
+    'latest': '',  # first shot not after this date, e.g. '2021-07-15'; '' for no limit
+    'weekdays': [0, 1, 2, 3, 4, 5, 6],  # allowed weekdays for both shots; 0 = Monday, 6 = Sunday
+    'min_gap': 0,  # minimum days between first and second shot
+    'centers': [],  # ZIP codes of the centers to auto book in, e.g. ['71636']; [] for all
+}
 
 
 # > Advanced Features
@@ -97,10 +160,63 @@ CONCURRENT_ENABLED: bool = False
 # How many processes / browsers to use (do not set this number higher
 #  than the amount of overall LOCATIONS defined)
 CONCURRENT_WORKERS: int = 3
+# Keep a pool of CONCURRENT_WORKERS warm browsers which are reused for the next location instead of
+# starting a new browser for every check. Only relevant if CONCURRENT_ENABLED or ASYNC_ENABLED
+POOL_ENABLED: bool = False
+# Replace a pooled browser after it has been used for n checks; 0 to reuse it forever
+POOL_MAX_USES: int = 20
+# Share Akamai cookies between all workers and persist them to `cookies.json`, so API sessions
+# can be reused after a restart and expired sessions don't always require a new browser
+COOKIE_STORE_ENABLED: bool = True
+# Seconds stored cookies are considered valid, unless the server sends a shorter expiry
+COOKIE_TTL: int = 60*30  # 30 Min
+# Seconds before the cached list of all centers (`impfzentren.json`) is revalidated with the server
+CENTERS_TTL: int = 60*60*6  # 6 Hours
 # Keep Browser open after workflow has crashed - helps to debug and possibly save important data;
 # however can backfire quickly as it can lead to an infinite amount of Browser windows. Also works
 # in combination with CONCURRENT_ENABLED
 KEEP_BROWSER_CRASH: bool = False
+# Hybrid polling: the browser is only used to pass the waiting room and enter the Vermittlungscode once;
+# afterwards appointments are searched via REST API every WAIT_HYBRID_POLLING seconds using the browser's
+# cookies. The browser is only used again if the session expires or appointments are found.
+# Only applies to locations with a Vermittlungscode; a REST call is a lot cheaper than a browser check
+HYBRID_ENABLED: bool = False
+# A Vermittlungscode is valid for all centers on the same server (001, 002, ...). Check all locations with a
+# code on the same server with one session and one code entry instead of one browser each. Requires HYBRID_ENABLED
+GROUP_BY_SERVER: bool = False
+# Run all locations in one asyncio event loop instead of one thread per location. Browsers are still
+# limited to CONCURRENT_WORKERS; in combination with HYBRID_ENABLED the browser is closed after entering
+# the Vermittlungscode and the location is polled browserless, so hundreds of locations can be monitored
+ASYNC_ENABLED: bool = False
+# Maximum number of simultaneous REST API requests if ASYNC_ENABLED
+ASYNC_MAX_REQUESTS: int = 4
+
+
+# Export Prometheus metrics (step durations, `429`s, errors, alerts) on http://127.0.0.1:METRICS_PORT/metrics
+METRICS_ENABLED: bool = False
+METRICS_PORT: int = 9464
+# Coordinator / worker mode: `python3 main.py --coordinator` hands out LOCATIONS to workers on other hosts started
+# with `python3 main.py --worker http://<coordinator>:COORDINATOR_PORT`. `429`s apply per IP, so every worker host adds
+# its own request budget. Workers use their own `settings.py` for everything but LOCATIONS; a worker getting a `429`
+# isn't leased locations on that server for WAIT_SHADOW_BAN and locations of crashed workers are re-assigned once
+# their lease expires
+COORDINATOR_PORT: int = 9465
+COORDINATOR_TOKEN: str = ''  # Shared secret workers authenticate with – set it unless the port is only reachable in your LAN
+COORDINATOR_LEASE: int = 60*5  # Seconds a worker keeps a location without heartbeat
+# Record every check outcome to `events.jsonl`; `python3 main.py --analyze` shows when slots appear per center
+# and writes `polling_profile.json`. With POLLING_PROFILE, SLEEP_NIGHT pauses the bot in the hours no slots
+# appeared in instead of 2300-0600
+EVENTS_ENABLED: bool = True
+POLLING_PROFILE: bool = False
+# Keep codes found invalid, `429` bans per server and when each location was last checked in `state.db`, so
+# after a restart dead codes aren't probed again, active bans are waited out and the least recently checked
+# locations go first
+STATE_ENABLED: bool = True
+
+
+# Base URL of the ImpfterminService; servers are reached at <id>-iz.<domain> (e.g. 003-iz.impfterminservice.de).
+# Set to e.g. 'http://www.localhost:5000' to run against the mock service in `tests/api_server.py`
+SERVICE_URL: str = 'https://www.impfterminservice.de'
 
 
 # Chromium Driver Path - leave empty to use auto detect
@@ -120,12 +236,36 @@ CHROME_PATH = r''
 # can be se to e.g. 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.77 Safari/537.36'
 USER_AGENT: str = 'default'
 
+# Run Chrome without a window – uses considerably less memory and CPU per browser, so more workers fit on
+# one host (no Xorg / VNC required). You can't take over the browser once appointments are found, so
+# BOOK_REMOTELY is strongly recommended
+HEADLESS: bool = False
+# URL patterns (wildcards allowed) a HEADLESS browser won't load – the bot only reads the page's DOM and API calls,
+# so images, fonts and analytics are just rendering cost. Set to [] to load everything
+BLOCK_URLS: list = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+    '*google-analytics.com*', '*googletagmanager.com*', '*etracker.com*'
+]
+
 
 # > Alerting Settings
 # ----------------------
 ALERT_SMS: str = 'Neuer Vermittlungscode für {{ LOCATION }}! SMS Code innerhalb der nächsten 10 Minuten übermitteln. (sms:123-456)'
 ALERT_AVAILABLE: str = 'Impftermine verfügbar in {{ LOCATION }}! Reserviert für die nächsten 10 Minuten... Buchungslink: {{ LINK }}'
 ALERT_BOOKINGS: str = ' **Verfügbare Termine:**\n\n{{ APPOINTMENTS }}'
+# Seconds before connecting to / reading from ImpfterminService is aborted; alerting backends use ALERT_TIMEOUT
+CONNECT_TIMEOUT: float = 5
+READ_TIMEOUT: float = 30
+# Talk HTTP/2 to ImpfterminService and the alerting backends (requires `pip install httpx[http2]`) – all
+# workers share keep-alive connections either way, so TLS handshakes are only paid once per connection
+HTTP2_ENABLED: bool = False
+# Seconds before a request to an alerting backend is aborted
+ALERT_TIMEOUT: int = 10
+# Wait for SMS codes / appointment replies on Zulip and Telegram using long polling instead of
+# checking every 15 seconds; a read returns as soon as a message arrives or after ALERT_POLL_TIMEOUT
+ALERT_LONG_POLLING: bool = True
+ALERT_POLL_TIMEOUT: int = 30
 
 # Run a custom command when a new appointment is found (e.g. audio alerts); if COMMAND_ENABLED is set to True, but no
 # command is supplied in COMMAND_LINE, script will automatically fall back to pre-configured Text-to-speech below:
@@ -1,15 +1,39 @@
 #!/usr/bin/env python3
-""" Impftermin Service Mock Backend """
-from random import randint
+""" Impftermin Service Mock Backend – stand-in for the landing page, waiting room, code form,
+booking pages and REST API of all servers. Servers are told apart by host name, e.g.
+http://www.localhost:5000 (landing page) and http://003-iz.localhost:5000 (server 003); set
+SERVICE_URL = 'http://www.localhost:5000' to point the bot at it.
 
-from flask import Flask, Response, request, jsonify, make_response, render_template
+Appointments are released for RELEASE_DURATION seconds every RELEASE_EVERY seconds (shifted per
+center); CHAOS_429 / CHAOS_481 are the probabilities of `429` / `481` responses """
+import argparse
+import json
+import os, sys
+import uuid
 from base64 import b64decode
+from functools import wraps
+from random import random
+from threading import Lock
+from time import time
 
-# TODO: Clean-up
-import os, sys
-sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from flask import Flask, Response, request, jsonify, make_response, render_template, redirect
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 import settings
 
+BM_SZ = '140EFSD342XOs8E139FEF9XASD2~YAAQV2ZWuGugTUZ5AQVVA7FCkwsD1DbT5fM7q0zs/uw9gmpbJwLKXLbs0a6QFVj6flaBovO577NTLMspOQNiTPnXXoCASD312VQrP/MhMwzOk8RbSD5nQavFzduYazPJLJxm34KePfrwjLA3+lNzODFds12MLcDu7QQDc6OGpJ27gw6jitsiL+JBL4QcvsmBL7RV6fX+vlu=='
+AKAVPAU = '1546795457~id=6255b1eh238943e08141b8fa231'
+AKAMAI = {'ak_bmsc': 'C4F3B4B3-MOCK', '_abck': 'A8C9D0E1F2~0~MOCK~-1~-1', 'bm_sv': 'B5A6C7D8E9-MOCK'}
+CENTERS = [
+    # Bundesland, PLZ, Ort, Zentrumsname, Server
+    ('Baden-Württemberg', '70174', 'Stuttgart', 'Zentrales Impfzentrum Liederhalle', '001'),
+    ('Baden-Württemberg', '70376', 'Stuttgart', 'Impfzentrum Robert-Bosch-Krankenhaus', '001'),
+    ('Baden-Württemberg', '71636', 'Ludwigsburg', 'Impfzentrum Ludwigsburg', '003'),
+    ('Baden-Württemberg', '71065', 'Sindelfingen', 'Impfzentrum Sindelfingen', '003'),
+    ('Baden-Württemberg', '75175', 'Pforzheim', 'Impfzentrum Pforzheim', '002'),
+    ('Hessen', '60327', 'Frankfurt am Main', 'Impfzentrum Frankfurt', '004'),
+]
+
 APPOINTMENTS = {
     "gesuchteLeistungsmerkmale": ["L920", "L921"],
     "termine": [
@@ -81,25 +105,166 @@ APPOINTMENTS = {
 
 def chaos_monkey(f):
     """ 1:1 implementation of the original ImpfterminService API """
+    @wraps(f)
     def func(*args, **kwargs):
-        if not randint(0,2):
-            return Response({}, status=429)
-        if 'termin_buchung' in f.__name__ and not randint(0,3):
-            return Response({}, status=481)
+        if random() < app.config['CHAOS_429']:
+            count('429')
+            return Response('{}', status=429, mimetype='application/json')
+        if 'buchung' in f.__name__ and random() < app.config['CHAOS_481']:
+            return Response('{}', status=481, mimetype='application/json')
         return f(*args, **kwargs)
     return func
 
 
 app = Flask(__name__, template_folder='res')
+app.config.update(
+    CHAOS_429=.1,
+    CHAOS_481=0,
+    WAITING_ROOM=.2,  # Probability of being sent to the waiting room
+    WAITING_SECONDS=5,
+    RELEASE_EVERY=600,
+    RELEASE_DURATION=120,
+)
+STARTED = time()
+STATS = {}
+_lock = Lock()
+
+
+def reset() -> None:
+    """ Restarts the release schedule and clears the statistics """
+    global STARTED
+    with _lock:
+        STARTED = time()
+        STATS.clear()
+        STATS.update({'requests': {}, '429': {}, 'bookings': []})
+
+
+def count(stat: str) -> None:
+    with _lock:
+        STATS[stat][server()] = STATS[stat].get(server(), 0) + 1
+
+
+def server() -> str:
+    """ Server id of the requested host (www, 001, 002, ...) """
+    return request.host.split('.')[0].split('-')[0]
+
+
+def release_start(plz: str, t: float = None) -> float:
+    """ Start of the latest release of appointments for plz before `t`; 0 if there was none yet """
+    t = t or time()
+    every = app.config['RELEASE_EVERY']
+    elapsed = t - STARTED - int(plz) % every
+    return t - elapsed % every if elapsed >= 0 else 0
+
+
+def available(plz: str) -> bool:
+    start = release_start(plz)
+    return bool(start) and time() - start < app.config['RELEASE_DURATION']
+
+
+def centers() -> dict:
+    """ impfzentren.json with the servers' URLs on the mock's host """
+    scheme, port = request.scheme, request.host.split(':')[1] if ':' in request.host else ''
+    catalog = {}
+    for state, plz, city, name, _server in CENTERS:
+        catalog.setdefault(state, []).append({
+            'Zentrumsname': name,
+            'PLZ': plz,
+            'Ort': city,
+            'Bundesland': state,
+            'URL': f'{scheme}://{_server}-iz.localhost{":" + port if port else ""}/'
+        })
+    return catalog
+
+
+reset()
+
+
+@app.before_request
+def statistics():
+    count('requests')
+
+
+@app.after_request
+def akamai(response):
+    """ Every page hands out the (mock) Akamai cookies """
+    if response.mimetype == 'text/html' and not request.cookies.get('bm_sz'):
+        response.set_cookie('bm_sz', BM_SZ)
+        response.set_cookie('akavpau_User_allowed', AKAVPAU)
+        for name, value in AKAMAI.items(): response.set_cookie(name, value)
+    return response
+
+
+@app.route('/impftermine', methods=['GET'])
+def landing_page():
+    return render_template('mock/landing.html', centers=centers())
+
+
+@app.route('/assets/static/impfzentren.json', methods=['GET'])
+def impfzentren():
+    return jsonify(centers())
+
+
+@app.route('/impftermine/service', methods=['GET'])
+def location_page():
+    if not request.cookies.get('waited') and random() < app.config['WAITING_ROOM']:
+        r = make_response(render_template('mock/waiting_room.html', seconds=app.config['WAITING_SECONDS']))
+        r.set_cookie('waited', '1')
+        return r
+    return render_template('mock/location.html', plz=request.args.get('plz'))
+
+
+@app.route('/impftermine/code', methods=['GET'])
+def code_form():
+    plz, code = request.args.get('plz'), '-'.join(request.args.getlist('code')).upper()
+    if random() < app.config['CHAOS_429']:
+        count('429')
+        error = 'Es ist ein unerwarteter Fehler aufgetreten. Bitte versuchen Sie es später erneut.'
+        return render_template('mock/location.html', plz=plz, error=error), 429
+    if len(code) != 14 or code.startswith('XXXX'):
+        return render_template('mock/location.html', plz=plz, error='Ungültiger Vermittlungscode')
+    return redirect(f'/impftermine/suche/{code}/{plz}')
 
-# TODO: Mock HTML sites + mock cookies + mock workflow
 
 @app.route('/impftermine/suche/<vermittlungscode>/<zip>')
-def termin_suche(*args, **kwargs):
-    return render_template('appointment_appointment_form.html')
+def termin_suche(vermittlungscode: str, zip: str):
+    salutations = list(dict.fromkeys(['Herr', 'Frau', 'Divers', settings.SALUTATION]))
+    return render_template('mock/search.html', code=vermittlungscode, plz=zip, salutations=salutations)
+
+
+@app.route('/impftermine/check', methods=['GET'])
+def code_claim():
+    return render_template('mock/check.html', plz=request.args.get('plz', ''))
+
+
+@app.route('/rest/suche/termincheck', methods=['GET'])
+@chaos_monkey
+def rest_termin_check():
+    return jsonify({'termineVorhanden': available(request.args.get('plz'))})
+
+
+@app.route('/rest/suche/termincheck/alter', methods=['POST'])
+@chaos_monkey
+def rest_termin_check_alter():
+    return jsonify({})
+
+
+@app.route('/rest/smspin/anforderung', methods=['POST'])
+@chaos_monkey
+def rest_smspin_anforderung():
+    assert request.json.get('plz')
+    return jsonify({'token': str(uuid.uuid4())})
+
 
+@app.route('/rest/smspin/verifikation', methods=['POST'])
 @chaos_monkey
+def rest_smspin_verifikation():
+    assert request.json.get('token')
+    return Response('{}', status=200 if len(request.json.get('smspin', '')) == 6 else 400, mimetype='application/json')
+
+
 @app.route('/rest/suche/impfterminsuche', methods=['GET'])
+@chaos_monkey
 def rest_termin_suche():
     assert request.headers.get('Referer')
     assert request.headers.get('Authorization')
@@ -111,16 +276,17 @@ def rest_termin_suche():
     assert plz.isdigit()
     assert _plz == plz
 
-    assert request.cookies.get('bm_sz') == '140EFSD342XOs8E139FEF9XASD2~YAAQV2ZWuGugTUZ5AQVVA7FCkwsD1DbT5fM7q0zs/uw9gmpbJwLKXLbs0a6QFVj6flaBovO577NTLMspOQNiTPnXXoCASD312VQrP/MhMwzOk8RbSD5nQavFzduYazPJLJxm34KePfrwjLA3+lNzODFds12MLcDu7QQDc6OGpJ27gw6jitsiL+JBL4QcvsmBL7RV6fX+vlu=='
-    assert request.cookies.get('akavpau_User_allowed') == '1546795457~id=6255b1eh238943e08141b8fa231'
+    assert request.cookies.get('bm_sz') == BM_SZ
+    assert request.cookies.get('akavpau_User_allowed') == AKAVPAU
 
     auth = b64decode(request.headers.get('Authorization').replace('Basic ', '')).decode("utf-8")
     assert auth == f':{_code}'
+    if not available(plz): return jsonify({**APPOINTMENTS, 'termine': []})
     return jsonify(APPOINTMENTS)
 
 
-@chaos_monkey
 @app.route('/rest/buchung', methods=['POST'])
+@chaos_monkey
 def rest_termin_buchung():
     assert request.headers.get('Referer')
     assert request.headers.get('Authorization')
@@ -130,33 +296,66 @@ def rest_termin_buchung():
     assert auth == f':{_code}'
 
     assert request.json
-    print('Request:', request.json)
+    app.logger.debug(f'Booking request: {request.json}')
 
     data = request.json
     data_contact = data.get('contact')
     assert len(data.get('slots')) == 2
     assert isinstance(data.get('qualifikationen'), list)
     assert _zip == data.get('plz')
-    assert data_contact.get('anrede') == settings.SALUTATION
-    assert data_contact.get('vorname') == settings.FIRST_NAME
-    assert data_contact.get('nachname') == settings.LAST_NAME
-    assert data_contact.get('strasse') == settings.STREET_NAME
-    assert data_contact.get('hausnummer') == settings.HOUSE_NUMBER
-    assert data_contact.get('plz') == settings.ZIP_CODE
-    assert data_contact.get('ort') == settings.CITY
-    assert data_contact.get('notificationReceiver') == settings.MAIL
+    # Any profile may book – only check the contact is complete
+    for key in ('anrede', 'vorname', 'nachname', 'strasse', 'hausnummer', 'plz', 'ort', 'notificationReceiver'):
+        assert isinstance(data_contact.get(key), str) and data_contact.get(key), key
     assert data_contact.get('notificationChannel') == 'email'
-    assert data_contact.get('phone') == f'+49 {settings.PHONE}'
+    assert data_contact.get('phone', '').startswith('+49 ')
 
+    with _lock:
+        STATS['bookings'].append({'t': time(), 'plz': data.get('plz'), 'server': server()})
     return Response('{}', status=201)
 
+
+@app.route('/mock/stats', methods=['GET'])
+def stats():
+    with _lock:
+        return jsonify({
+            'started': STARTED,
+            'release_every': app.config['RELEASE_EVERY'],
+            'release_duration': app.config['RELEASE_DURATION'],
+            **STATS
+        })
+
+
 @app.route('/', methods=['GET'])
 def landing():
     r = make_response('https://github.com/alfonsrv/impf-botpy')
     # TODO: Maybe do timestamp checking
-    r.set_cookie('bm_sz', '140EFSD342XOs8E139FEF9XASD2~YAAQV2ZWuGugTUZ5AQVVA7FCkwsD1DbT5fM7q0zs/uw9gmpbJwLKXLbs0a6QFVj6flaBovO577NTLMspOQNiTPnXXoCASD312VQrP/MhMwzOk8RbSD5nQavFzduYazPJLJxm34KePfrwjLA3+lNzODFds12MLcDu7QQDc6OGpJ27gw6jitsiL+JBL4QcvsmBL7RV6fX+vlu==')
-    r.set_cookie('akavpau_User_allowed', '1546795457~id=6255b1eh238943e08141b8fa231')
+    r.set_cookie('bm_sz', BM_SZ)
+    r.set_cookie('akavpau_User_allowed', AKAVPAU)
     return r
 
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Impftermin Service Mock Backend')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--chaos-429', type=float, default=app.config['CHAOS_429'])
+    parser.add_argument('--chaos-481', type=float, default=app.config['CHAOS_481'])
+    parser.add_argument('--waiting-room', type=float, default=app.config['WAITING_ROOM'])
+    parser.add_argument('--release-every', type=int, default=app.config['RELEASE_EVERY'])
+    parser.add_argument('--release-duration', type=int, default=app.config['RELEASE_DURATION'])
+    return parser.parse_args(args)
+
+
+def configure(args: argparse.Namespace) -> None:
+    app.config.update(
+        CHAOS_429=args.chaos_429,
+        CHAOS_481=args.chaos_481,
+        WAITING_ROOM=args.waiting_room,
+        RELEASE_EVERY=args.release_every,
+        RELEASE_DURATION=args.release_duration,
+    )
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    args = parse_args()
+    configure(args)
+    app.run(port=args.port, threaded=True)
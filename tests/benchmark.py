@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+""" End-to-end benchmark against the mock ImpfterminService (tests/api_server.py) – runs the bot
+in each mode for a fixed duration and reports checks per minute, time-to-detect (appointments
+released → found by the bot) and time-to-book (appointments released → booked)
+
+    python3 tests/benchmark.py --modes sequential concurrent hybrid --duration 900
+
+Each mode runs in its own process with the settings in `MODES` applied on top of `settings.py`
+and a separate WORK_DIR, so events, cookies and center catalog don't leak between modes """
+import argparse
+import json
+import os, sys
+import signal
+import socket
+import subprocess
+import tempfile
+from statistics import mean, median
+from threading import Thread
+from time import sleep
+from typing import Dict, List
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+MODES = {
+    'sequential': {},
+    'concurrent': {'CONCURRENT_ENABLED': True},
+    'hybrid': {'CONCURRENT_ENABLED': True, 'HYBRID_ENABLED': True},
+    'grouped': {'CONCURRENT_ENABLED': True, 'HYBRID_ENABLED': True, 'GROUP_BY_SERVER': True},
+    'async': {'ASYNC_ENABLED': True, 'HYBRID_ENABLED': True},
+    'rate-limited': {'CONCURRENT_ENABLED': True, 'HYBRID_ENABLED': True, 'RATE_LIMIT_ENABLED': True},
+}
+LOCATIONS = [
+    {'location': '70174 Stuttgart', 'code': 'Q123-ABCD-C0DE'},
+    {'location': '70376 Stuttgart', 'code': 'Q123-ABCD-C0DE'},
+    {'location': '71636 Ludwigsburg', 'code': 'Q123-ABCD-C0DE'},
+    {'location': '71065 Sindelfingen', 'code': 'Q123-ABCD-C0DE'},
+    {'location': '75175 Pforzheim', 'code': 'Q123-ABCD-C0DE'},
+]
+
+
+def resolve_localhost() -> None:
+    """ Resolves *.localhost to the loopback interface (RFC 6761) – Chrome does so
+    by itself, but not every system resolver used by requests does """
+    getaddrinfo = socket.getaddrinfo
+
+    def _getaddrinfo(host, *args, **kwargs):
+        if isinstance(host, str) and host.endswith('.localhost'): host = '127.0.0.1'
+        return getaddrinfo(host, *args, **kwargs)
+
+    socket.getaddrinfo = _getaddrinfo
+
+
+def worker(mode: str, port: int, work_dir: str) -> None:
+    """ Runs the bot in `mode` against the mock until terminated """
+    resolve_localhost()
+    import settings
+    settings.WORK_DIR = work_dir
+    settings.SERVICE_URL = f'http://www.localhost:{port}'
+    settings.LOCATIONS = LOCATIONS
+    settings.BUNDESLAND = 'Baden-Württemberg'
+    settings.EVENTS_ENABLED = True
+    settings.SLEEP_NIGHT = False
+    settings.RESCAN_APPOINTMENT = True
+    settings.KEEP_BROWSER = False
+    # Book the earliest appointment right away, so time-to-book is measured without chat replies
+    settings.AUTO_BOOK = True
+    settings.AUTO_BOOK_RULES = {'order': 'earliest', 'earliest': '', 'latest': '', 'weekdays': list(range(7)),
+                                'min_gap': 0, 'centers': []}
+    for backend in ('COMMAND', 'ZULIP', 'TELEGRAM', 'SLACK', 'PUSHOVER', 'GOTIFY'):
+        setattr(settings, f'{backend}_ENABLED', False)
+    for setting, value in MODES[mode].items():
+        setattr(settings, setting, value)
+
+    import main
+    main.run()
+
+
+def run_mode(mode: str, port: int, duration: int) -> Dict:
+    import api_server
+    api_server.reset()
+    with tempfile.TemporaryDirectory() as work_dir:
+        p = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker', mode, '--port', str(port), '--work-dir', work_dir],
+            start_new_session=True
+        )
+        sleep(duration)
+        os.killpg(p.pid, signal.SIGTERM)  # including the Chrome instances
+        p.wait()
+        return report(mode, duration, os.path.join(work_dir, 'events.jsonl'))
+
+
+def report(mode: str, duration: int, path: str) -> Dict:
+    import api_server
+    from impf import events
+    recorded = list(events.read(path))
+    checks = [e for e in recorded if e.get('o') in events.CHECKED]
+
+    detect, found_before = [], {}
+    for event in checks:
+        found = event.get('o') in events.FOUND
+        if found and not found_before.get(event.get('l')):
+            released = api_server.release_start(event.get('l'), event.get('t'))
+            if released: detect.append(event.get('t') - released)
+        found_before[event.get('l')] = found
+
+    book = [b['t'] - api_server.release_start(b['plz'], b['t']) for b in api_server.STATS['bookings']]
+    return {
+        'mode': mode,
+        'checks_per_minute': len(checks) / duration * 60,
+        'too_many_requests': sum(api_server.STATS['429'].values()),
+        'requests': sum(api_server.STATS['requests'].values()),
+        'detected': len(detect),
+        'time_to_detect': median(detect) if detect else None,
+        'time_to_detect_mean': mean(detect) if detect else None,
+        'booked': len(book),
+        'time_to_book': median(book) if book else None,
+    }
+
+
+def print_results(results: List[Dict]) -> None:
+    fmt = lambda v: '-' if v is None else f'{v:.1f}' if isinstance(v, float) else str(v)
+    columns = ['mode', 'checks_per_minute', 'requests', 'too_many_requests', 'detected',
+               'time_to_detect', 'time_to_detect_mean', 'booked', 'time_to_book']
+    print('\t'.join(columns))
+    for result in results:
+        print('\t'.join(fmt(result[c]) for c in columns))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark Impf Bot.py against the mock ImpfterminService')
+    parser.add_argument('--modes', nargs='+', choices=MODES.keys(), default=['sequential', 'concurrent', 'hybrid'])
+    parser.add_argument('--duration', type=int, default=600, help='Seconds to run each mode for')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--json', help='Write results to file')
+    parser.add_argument('--worker', choices=MODES.keys(), help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    args, mock_args = parser.parse_known_args()
+
+    if args.worker:
+        worker(args.worker, args.port, args.work_dir)
+        exit()
+
+    import api_server
+    api_server.configure(api_server.parse_args(mock_args + ['--port', str(args.port)]))
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', args.port, api_server.app, threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    results = []
+    for mode in args.modes:
+        print(f'Benchmarking {mode} for {args.duration}s...')
+        results.append(run_mode(mode, args.port, args.duration))
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
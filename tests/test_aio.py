@@ -0,0 +1,42 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+import asyncio
+from types import SimpleNamespace
+from impf import aio
+
+
+class FakeBrowser:
+	def __init__(self):
+		self.driver = SimpleNamespace(get_cookies=lambda: [{'name': 'bm_sz', 'value': '1'}])
+
+	def main_page(self): pass
+
+	def location_page(self): pass
+
+
+class FakePool:
+	def __init__(self):
+		self.acquired = []
+
+	def acquire(self, location):
+		self.acquired.append(location)
+		return FakeBrowser()
+
+	def release(self, x): pass
+
+
+def test_cookie_source_bounded():
+	async def main():
+		browsers, pool = asyncio.Semaphore(1), FakePool()
+		refresh = aio.cookie_source(browsers, pool)
+		api = SimpleNamespace(zip_code='71636', code='Q123-ABCD-C0DE')
+		async with browsers:  # all browsers busy
+			future = asyncio.get_running_loop().run_in_executor(None, refresh, api)
+			await asyncio.sleep(0.2)
+			assert not pool.acquired
+		cookies = await future
+		assert cookies[0]['name'] == 'bm_sz'
+		assert pool.acquired == [{'location': '71636', 'code': 'Q123-ABCD-C0DE'}]
+		assert not browsers.locked()
+
+	asyncio.run(main())
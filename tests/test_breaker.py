@@ -0,0 +1,49 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from threading import Thread
+from time import sleep, time
+from impf.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+def test_open_and_close():
+	breaker = CircuitBreaker(server='003', cooldown=0.2, maximum=1)
+	assert breaker.acquire() < 0.1
+	breaker.record(True)
+	assert breaker.state == OPEN and breaker.remaining() > 0
+
+	assert breaker.acquire() >= 0.15
+	assert breaker.state == HALF_OPEN
+	breaker.record(True)  # probe rate limited as well
+	assert breaker.state == OPEN and breaker.remaining() > 0.3
+
+	breaker.acquire()
+	breaker.record(False)
+	assert breaker.state == CLOSED and breaker.remaining() == 0
+
+
+def test_single_probe():
+	breaker = CircuitBreaker(server='003', cooldown=0.1, maximum=1)
+	breaker.record(True)
+	passed = []
+
+	def worker():
+		breaker.acquire()
+		passed.append(time())
+
+	threads = [Thread(target=worker) for _ in range(3)]
+	for thread in threads: thread.start()
+	sleep(0.3)
+	assert len(passed) == 1  # only the probe got through
+	breaker.record(False)
+	for thread in threads: thread.join(1)
+	assert len(passed) == 3
+
+
+def test_straggler_keeps_backoff():
+	breaker = CircuitBreaker(server='003', cooldown=0.2, maximum=1)
+	breaker.record(True)
+	breaker.acquire()
+	breaker.record(True)  # probe rate limited – cooldown doubled
+	assert breaker._wait == 0.4
+	breaker.record(True)  # in-flight request of another worker arriving late
+	assert breaker.state == OPEN and breaker._wait == 0.4
@@ -9,7 +9,7 @@ def test_monolith():
 		code='Q29X-AX2F-TPC7',
 		location_full='71636 Ludwigsburg, Impfzentrum Ludwigsburg'
 	)
-	x.driver.get('http://127.0.0.1:5000/impftermine/suche/Q29X-AX2F-TPC7/71636')
+	x.driver.get('http://003-iz.localhost:5000/impftermine/suche/Q29X-AX2F-TPC7/71636')  # tests/api_server.py
 	x.book_appointment(2)
 
 test_monolith()
\ No newline at end of file
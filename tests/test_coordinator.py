@@ -0,0 +1,44 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from time import time
+from impf import events
+from impf.coordinator import Coordinator, Worker
+
+
+def locations() -> list:
+	return [{'location': '71636 Ludwigsburg', 'code': 'Q123-ABCD-C0DE'}, {'location': '70174 Stuttgart', 'code': ''}]
+
+
+def test_lease():
+	coordinator = Coordinator(locations=locations(), ttl=60)
+	a, b = coordinator.lease('a'), coordinator.lease('b')
+	assert {a.idx, b.idx} == {0, 1}
+	assert coordinator.lease('c') is None
+
+	a.expires = time() - 1  # worker a crashed
+	c = coordinator.lease('c')
+	assert c.idx == a.idx
+	assert not coordinator.heartbeat(a.id) and coordinator.heartbeat(c.id)
+
+
+def test_report():
+	coordinator = Coordinator(locations=locations(), ttl=60)
+	lease = coordinator.lease('a')
+	assert coordinator.report(lease.id, {**coordinator.locations[0], 'code': ''}, '003', events.TOO_MANY_REQUESTS)
+	assert coordinator.locations[0]['code'] == ''
+	assert not coordinator.report(lease.id, {}, '003')
+
+	# banned on server 003, so only location 1 is left for a
+	assert coordinator.lease('a').idx == 1
+	assert coordinator.lease('a') is None
+	assert coordinator.lease('b').idx == 0
+
+
+def test_worker_report(monkeypatch):
+	worker = Worker('http://localhost:8081/')
+	posted = []
+	monkeypatch.setattr(worker, '_post', lambda path, **data: posted.append((path, data)))
+	result = {**locations()[0], 'server': '003', 'outcome': events.TOO_MANY_REQUESTS}
+	worker.report({'lease': 'l1'}, result)
+	assert posted == [('/report', {'lease': 'l1', 'location': locations()[0],
+	                               'server': '003', 'outcome': events.TOO_MANY_REQUESTS})]
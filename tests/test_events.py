@@ -0,0 +1,30 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from datetime import datetime
+from impf import events
+
+
+def at(hour: int, minute: int = 0) -> int:
+	return int(datetime(2021, 6, 1, hour, minute).timestamp())
+
+
+def test_slots_appeared():
+	checks = [
+		{'t': at(7), 'l': '71636', 's': '003', 'o': events.NO_APPOINTMENTS},
+		{'t': at(8), 'l': '71636', 's': '003', 'o': events.APPOINTMENTS, 'n': 2},
+		{'t': at(8, 5), 'l': '71636', 's': '003', 'o': events.APPOINTMENTS, 'n': 1},
+		{'t': at(8, 10), 'l': '71636', 's': '003', 'o': events.TOO_MANY_REQUESTS},
+		{'t': at(9), 'l': '70174', 's': '003', 'o': events.VACANCY},
+	]
+	centers = events.histograms(iter(checks))
+	assert centers['71636']['checks'][8] == 2
+	assert centers['71636']['appeared'][8] == 1
+	assert centers['70174']['appeared'][9] == 1
+
+
+def test_profile():
+	checks = [{'t': at(3, m), 'l': '71636', 's': '003', 'o': events.NO_APPOINTMENTS} for m in range(events.MIN_CHECKS)]
+	checks.append({'t': at(9), 'l': '71636', 's': '003', 'o': events.APPOINTMENTS})
+	profile = events.profile(events.histograms(iter(checks)))
+	assert 3 not in profile['active']
+	assert 9 in profile['active'] and 4 in profile['active']
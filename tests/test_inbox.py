@@ -0,0 +1,25 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from impf.inbox import Inbox, Waiter, parse_reply
+
+
+def test_parse_reply():
+	assert parse_reply('sms:123-456') == ('sms', '', '123456')
+	assert parse_reply(' sms:71636:123456') == ('sms', '71636', '123456')
+	assert parse_reply('appt:2') == ('appt', '', '2')
+	assert parse_reply('appt:71636:1') == ('appt', '71636', '1')
+	assert parse_reply('hello') == ('', '', '')
+
+
+def test_dispatch_to_one_waiter():
+	inbox = Inbox()
+	first, second = Waiter(case='appt', zip_code='71636'), Waiter(case='appt', zip_code='70174')
+	inbox._waiters.extend([first, second])
+	inbox.dispatch('appt:70174:1')
+	assert second.code == '1' and not first.code
+	inbox.dispatch('appt:3')
+	assert first.code == '3'
+	# Nobody is waiting anymore – kept for the next waiter
+	inbox.dispatch('sms:123-456')
+	assert inbox.wait('sms', '71636', timeout=0) == '123456'
+	assert inbox.wait('sms', '71636', timeout=0) == ''
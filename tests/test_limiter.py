@@ -0,0 +1,22 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from impf.limiter import TokenBucket
+
+
+def test_aimd():
+	bucket = TokenBucket(rate=6, minimum=1, maximum=8, increase=1, decrease=.5)
+	bucket.success()
+	bucket.success()
+	bucket.success()
+	assert bucket.rate == 8
+	bucket.penalize()
+	assert bucket.rate == 4
+	for _ in range(5): bucket.penalize()
+	assert bucket.rate == 1
+
+
+def test_penalize_drops_tokens():
+	bucket = TokenBucket(rate=60, minimum=1, maximum=60, increase=1, decrease=.5)
+	assert bucket.delay() == 0
+	bucket.penalize()
+	assert bucket.delay() > 1.9
@@ -0,0 +1,50 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+import json
+import logging
+import settings
+from impf import locations
+
+
+class FakeBrowser:
+	location = '71636 Ludwigsburg'
+	code = ''
+	logger = logging.getLogger(__name__)
+
+
+def write(path, data) -> None:
+	with open(path, 'w') as f:
+		f.write(data if isinstance(data, str) else json.dumps(data))
+	os.utime(path, (locations._mtime + 1, locations._mtime + 1))
+
+
+def test_reload(tmp_path, monkeypatch):
+	path = str(tmp_path / 'locations.json')
+	monkeypatch.setattr(locations, 'LOCATIONS_PATH', path)
+	monkeypatch.setattr(settings, 'LOCATIONS', [])
+	generation = locations.generation
+
+	write(path, [{'location': '71636 Ludwigsburg', 'code': ''}])
+	assert locations.load()
+	assert settings.LOCATIONS == [{'location': '71636 Ludwigsburg', 'code': ''}]
+	assert not locations.load()  # unchanged
+
+	write(path, '[{"location": "Ludwigsburg"}]')
+	assert not locations.load()
+	assert locations.generation == generation + 1
+
+	browser = FakeBrowser()
+	locations.attach(browser)
+	write(path, [{'location': '71636 Ludwigsburg', 'code': 'Q123-ABCD-C0DE'}])
+	assert locations.load()
+	locations.apply()
+	assert browser.code == 'Q123-ABCD-C0DE'
+	locations.detach(browser)
+
+
+def test_invalidate(monkeypatch):
+	monkeypatch.setattr(settings, 'LOCATIONS', [{'location': '71636 Ludwigsburg', 'code': 'Q123-ABCD-C0DE'}])
+	monkeypatch.setattr(settings, 'PROFILES', [{'name': 'Erika', 'codes': {'71636': 'Q123-ABCD-C0DE'}}])
+	locations.invalidate({'location': '71636 Ludwigsburg', 'code': 'Q123-ABCD-C0DE'})
+	assert settings.LOCATIONS[0]['code'] == ''
+	assert settings.PROFILES[0]['codes']['71636'] == ''
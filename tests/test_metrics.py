@@ -0,0 +1,14 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from impf import metrics
+
+
+def test_render():
+	metrics.inc('impf_too_many_requests_total', server='003')
+	metrics.inc('impf_too_many_requests_total', server='003')
+	metrics.observe('impf_step_seconds', .3, step='fill_code', location='71636', server='003')
+	text = metrics.render()
+	assert 'impf_too_many_requests_total{server="003"} 2' in text
+	assert 'impf_step_seconds_bucket{location="71636",server="003",step="fill_code",le="0.25"} 0' in text
+	assert 'impf_step_seconds_bucket{location="71636",server="003",step="fill_code",le="0.5"} 1' in text
+	assert 'impf_step_seconds_count{location="71636",server="003",step="fill_code"} 1' in text
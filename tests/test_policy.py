@@ -0,0 +1,34 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from datetime import datetime
+from impf import policy
+
+
+def termin(day: int, hour: int = 10) -> dict:
+	return {'slotId': f'{day}-{hour}', 'begin': int(datetime(2021, 6, day, hour).timestamp() * 1000)}
+
+
+# 2021-06-01 is a Tuesday
+TERMINE = [
+	[termin(12), termin(26)],  # Sat, Sat
+	[termin(3), termin(17)],  # Thu, Thu
+	[termin(1), termin(8)],  # Tue, Tue
+]
+
+
+def test_earliest():
+	assert policy.pick(TERMINE, '71636', {}) == 3
+	assert policy.pick(TERMINE, '71636', {'order': 'latest'}) == 1
+
+
+def test_rules():
+	assert policy.pick(TERMINE, '71636', {'earliest': '2021-06-02'}) == 2
+	assert policy.pick(TERMINE, '71636', {'latest': '2021-06-02', 'min_gap': 10}) == 0
+	assert policy.pick(TERMINE, '71636', {'weekdays': [5, 6]}) == 1
+	assert policy.pick(TERMINE, '71636', {'min_gap': 14}) == 2
+
+
+def test_centers():
+	assert policy.pick(TERMINE, '71636', {'centers': ['70174']}) == 0
+	assert policy.pick(TERMINE, '70174', {'centers': ['70174']}) == 3
+	assert policy.pick([], '70174', {}) == 0
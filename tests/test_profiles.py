@@ -0,0 +1,53 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+import settings
+from impf import profiles
+
+LOCATIONS = [{'location': '71636 Ludwigsburg', 'code': 'Q123-ABCD-C0DE'}, {'location': '70174 Stuttgart', 'code': ''}]
+PROFILES = [{'name': 'Erika', 'codes': {'71636': 'Q456-EFGH-C0DE', '70174': 'Q789-IJKL-C0DE'}, 'FIRST_NAME': 'Erika'}]
+
+
+def test_profiles(monkeypatch):
+	monkeypatch.setattr(settings, 'LOCATIONS', LOCATIONS)
+	monkeypatch.setattr(settings, 'PROFILES', PROFILES)
+	default, erika = profiles.profiles()
+	assert default.primary and not erika.primary
+	assert erika.contact['vorname'] == 'Erika'
+	assert erika.contact['nachname'] == settings.LAST_NAME
+
+
+def test_subscribers(monkeypatch):
+	monkeypatch.setattr(settings, 'LOCATIONS', LOCATIONS)
+	monkeypatch.setattr(settings, 'PROFILES', PROFILES)
+	subscribers = profiles.subscribers('71636', 'Q456-EFGH-C0DE')
+	assert [(p.name, code) for p, code in subscribers] == [('Erika', 'Q456-EFGH-C0DE'), (settings.FIRST_NAME, 'Q123-ABCD-C0DE')]
+
+
+def test_locations(monkeypatch):
+	monkeypatch.setattr(settings, 'LOCATIONS', LOCATIONS)
+	monkeypatch.setattr(settings, 'PROFILES', PROFILES)
+	locations = profiles.locations()
+	assert locations[0]['code'] == 'Q123-ABCD-C0DE'
+	assert locations[1]['code'] == 'Q789-IJKL-C0DE'
+	assert LOCATIONS[1]['code'] == ''
+
+
+def test_failed_booking_keeps_appointment(monkeypatch):
+	from impf import api
+	monkeypatch.setattr(settings, 'LOCATIONS', LOCATIONS)
+	monkeypatch.setattr(settings, 'PROFILES', PROFILES)
+	monkeypatch.setattr(settings, 'AUTO_BOOK', True)
+	monkeypatch.setattr(settings, 'AUTO_BOOK_RULES', {})
+	monkeypatch.setattr(api, 'send_alert', lambda *args, **kwargs: None)
+	termine = [[{'slotId': 'a', 'begin': 1622530800000}], [{'slotId': 'b', 'begin': 1622617200000}]]
+	monkeypatch.setattr(api.API, 'control_appointments', lambda self: {'termine': termine})
+	booked = []
+
+	def book_appointment(self, appointments, idx, profile=None, code=''):
+		booked.append((profile.name, appointments['termine'][idx - 1][0]['slotId']))
+		return profile.primary  # booking for Erika fails
+
+	monkeypatch.setattr(api.API, 'book_appointment', book_appointment)
+	x = api.API(_zip_code='71636', _code='Q456-EFGH-C0DE')
+	x.remote_booking()
+	assert booked == [('Erika', 'a'), (settings.FIRST_NAME, 'a')]
@@ -0,0 +1,40 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from impf.slots import SlotTracker
+
+
+def termin(slot: str, day: int) -> dict:
+	return {'slotId': slot, 'begin': 1622530800000 + day * 86400000}
+
+
+def test_changes():
+	tracker = SlotTracker()
+	first = [[termin('a', 1), termin('b', 29)], [termin('c', 2), termin('d', 30)]]
+	changes = tracker.update('71636', first)
+	assert changes and len(changes.new) == 2 and not changes.gone
+
+	assert not tracker.update('71636', list(reversed(first)))  # same slots, different order
+
+	changes = tracker.update('71636', [first[0], [termin('e', 3), termin('f', 31)]])
+	assert changes.new == [[termin('e', 3), termin('f', 31)]]
+	assert [slot for slot, _ in changes.gone] == ['c', 'd']
+	assert 'New: ' in changes.summary() and 'Gone: ' in changes.summary()
+
+
+def test_reappearing():
+	tracker = SlotTracker()
+	termine = [[termin('a', 1), termin('b', 29)]]
+	assert tracker.update('71636', termine)
+	assert not tracker.update('71636', [[termin('a', 1)]])  # only gone
+	assert tracker.update('70174', termine)  # other center
+	tracker.update('71636', [])
+	assert tracker.update('71636', termine)
+
+
+def test_diff_without_store():
+	tracker = SlotTracker()
+	termine = [[termin('a', 1), termin('b', 29)]]
+	assert tracker.diff('71636', termine)
+	assert tracker.diff('71636', termine)  # alert failed – still new
+	tracker.store('71636', termine)
+	assert not tracker.diff('71636', termine)
@@ -0,0 +1,34 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from time import time
+from impf.state import StateStore
+
+
+def test_resume(tmp_path):
+	path = str(tmp_path / 'state.db')
+	store = StateStore(path=path)
+	assert store.open()
+	store.invalidate('71636', 'Q123-ABCD-C0DE', 'already used')
+	store.ban('003', 600)
+	store.ban('004', 600)
+	store.unban('004')
+	store.checked('71636', '003', 'no_appointments')
+	store.checkpoint()
+	assert not os.path.exists(path + '-wal') or not os.path.getsize(path + '-wal')
+
+	resumed = StateStore(path=path)
+	assert resumed.open()
+	assert not resumed.valid('71636', 'Q123-ABCD-C0DE')
+	assert resumed.valid('70174', 'Q123-ABCD-C0DE')
+	assert set(resumed._resumed) == {'003'}
+	assert time() - resumed.last_checked('71636') < 60
+	assert resumed.last_checked('70174') == 0
+	resumed.checkpoint()
+
+
+def test_checkpoint_during_write(tmp_path):
+	store = StateStore(path=str(tmp_path / 'state.db'))
+	assert store.open()
+	with store._lock:  # SIGTERM arriving on the main thread while it writes
+		store.checkpoint()
+	assert store._conn is None